@@ -0,0 +1,3 @@
+"""
+Route blueprints, registered by ``create_app``.
+"""
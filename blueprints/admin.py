@@ -0,0 +1,423 @@
+"""
+Users, branches, reports, data exports, admin APIs and the maintenance CLI commands.
+"""
+
+from flask import (
+    Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, Response,
+    stream_with_context
+)
+from flask_login import login_required, current_user
+from werkzeug.security import generate_password_hash
+import hmac
+import json
+import re
+import statistics
+import subprocess
+import sys
+import click
+from migrations import full_scans, migration_status
+from storage import storage_report
+from extensions import db
+from models import User, Branch, Category, Product, ProductBarcode, PurchaseInvoice
+from forms import UserForm, BranchForm
+from helpers import (
+    sweep_expired_holds, held_maintenance_stats, checkpoint_stock, reconcile_stock, migrate_database,
+    PLAN_CHECK_URLS, PLAN_CHECK_TABLES, current_version, product_cache, product_search_index, search_index_state,
+    product_list_query_counts, rebuild_low_stock, compute_reorder_suggestions, rebuild_sales_rollups,
+    REPORT_TYPES, parse_report_range, day_bounds, run_report, report_request_args, EXPORT_FORMATS, EXPORTS,
+    stream_rows, csv_chunks, xlsx_chunks
+)
+
+bp = Blueprint('admin', __name__, cli_group=None)
+
+@bp.cli.command('sweep-held')
+def sweep_held_command():
+    """Remove expired held transactions now."""
+    print(f'Removed {sweep_expired_holds()} expired held transactions')
+
+@bp.cli.command('checkpoint-stock')
+def checkpoint_stock_command():
+    """Fold new stock movements into the ledger checkpoints."""
+    print(f'Checkpointed {checkpoint_stock()} product/branch pairs')
+
+@bp.cli.command('reconcile-stock')
+@click.option('--full', is_flag=True, help='Check every product/branch, not only those changed since the checkpoint.')
+def reconcile_stock_command(full):
+    """Report inventory that disagrees with the movement ledger."""
+    drift = reconcile_stock(full=full)
+    for row in drift:
+        print(f"product {row['product_id']} branch {row['branch_id']}: inventory {row['inventory_quantity']}, "
+              f"ledger {row['ledger_quantity']}, drift {row['drift']:+d}")
+    print(f'{len(drift)} pairs drifted')
+
+@bp.cli.command('storage-check')
+def storage_check_command():
+    """Show the effective database settings and warnings."""
+    report = storage_report(db.engine, current_app.config)
+    for key, value in report['settings'].items():
+        print(f'{key:>16}: {value}')
+    for warning in report['warnings']:
+        print(f'WARNING: {warning}')
+    pending = [version for version, _, applied_at in migration_status(db.engine) if applied_at is None]
+    if pending:
+        print(f"WARNING: schema migrations {', '.join(map(str, pending))} are pending; run 'flask --app app migrate'")
+
+@bp.cli.command('migrate')
+@click.option('--status', is_flag=True, help='List the migrations and when each was applied.')
+def migrate_command(status):
+    """Apply pending schema migrations."""
+    if status:
+        for version, name, applied_at in migration_status(db.engine):
+            print(f"{version:>4}  {applied_at.strftime('%Y-%m-%d %H:%M') if applied_at else 'pending':<16}  {name}")
+        return
+    applied = migrate_database(log=print)
+    print(f"Applied {len(applied)} migrations" if applied else 'Schema is up to date')
+
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail when a hot route's queries scan a whole large table."""
+    admin = User.query.filter_by(role='admin', is_active=True).first()
+    if admin is None:
+        raise click.ClickException('An active admin user is needed to request the routes')
+
+    values = {
+        'branch_id': db.session.query(db.func.min(Branch.id)).scalar(),
+        'product_id': db.session.query(db.func.min(Product.id)).scalar(),
+        'product_name': db.session.query(Product.name).order_by(Product.id).limit(1).scalar(),
+        'invoice_id': db.session.query(db.func.min(PurchaseInvoice.id)).scalar(),
+        'barcode': db.session.query(ProductBarcode.barcode).order_by(ProductBarcode.id).limit(1).scalar(),
+        'category_id': db.session.query(db.func.min(Category.id)).scalar(),
+        'catalog_version': max(current_version('catalog') - 1, 0),
+    }
+    urls = []
+    for url in PLAN_CHECK_URLS:
+        names = re.findall(r'\{(\w+)\}', url)
+        if all(values[name] is not None for name in names):
+            urls.append(url.format(**values))
+
+    client = current_app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['_user_id'] = str(admin.id)
+        client_session['_fresh'] = True
+
+    statements = []
+
+    def capture_statement(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip()[:6].upper() in ('SELECT', 'WITH'):
+            statements.append((statement, parameters))
+
+    # One pass first so one-off loads (search index, product cache) are not judged
+    for url in urls:
+        client.get(url)
+
+    failures = []
+    for url in urls:
+        del statements[:]
+        db.event.listen(db.engine, 'before_cursor_execute', capture_statement)
+        try:
+            response = client.get(url)
+        finally:
+            db.event.remove(db.engine, 'before_cursor_execute', capture_statement)
+        if response.status_code >= 400:
+            failures.append(f'{url}: HTTP {response.status_code}')
+            continue
+        with db.engine.connect() as connection:
+            for statement, parameters in statements:
+                for table in sorted(full_scans(connection, statement, parameters, PLAN_CHECK_TABLES)):
+                    failures.append(f"{url}: full scan of {table} in {' '.join(statement.split())[:160]}")
+        print(f'{url}: {len(statements)} queries checked')
+
+    if failures:
+        for failure in dict.fromkeys(failures):
+            print(failure)
+        raise click.ClickException(f'{len(set(failures))} query plan problems')
+    print('No full scans of large tables')
+
+@bp.cli.command('check-products-list')
+@click.option('--pages', default=3, help='Number of pages to compare.')
+def check_products_list_command(pages):
+    """Check the product list issues the same number of queries on every page."""
+    counts = product_list_query_counts(pages)
+    print(f"Queries per page: {', '.join(str(n) for n in counts)}")
+    if len(set(counts)) > 1 or max(counts) > 2:
+        raise click.ClickException('Query count grows with the page contents')
+
+# Libraries that are imported where they are used, never while the app starts
+LAZY_IMPORTS = ('PIL', 'qrcode', 'reportlab', 'openpyxl', 'numpy')
+
+# Run in a fresh interpreter: time a cold import and build of the app
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps([elapsed, sorted(name for name in sys.argv[1:] if name in sys.modules)]))
+"""
+
+def measure_startup(runs, root_path):
+    """Time ``runs`` cold starts in fresh interpreters; returns the timings in ms and the lazy libraries loaded"""
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_PROBE, *LAZY_IMPORTS],
+            cwd=root_path, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f'App failed to start:\n{result.stderr.strip()}')
+        elapsed, modules = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(elapsed)
+        loaded.update(modules)
+    return timings, loaded
+
+@bp.cli.command('check-startup')
+@click.option('--runs', default=5, help='Number of cold starts to time.')
+@click.option('--budget-ms', type=float, default=None, help='Allowed median start time; defaults to STARTUP_BUDGET_MS.')
+def check_startup_command(runs, budget_ms):
+    """Check a cold start stays within budget and loads no lazily imported library."""
+    budget_ms = budget_ms or current_app.config['STARTUP_BUDGET_MS']
+    try:
+        timings, loaded = measure_startup(runs, current_app.root_path)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    median = statistics.median(timings)
+    print(f"Startup: median {median:.0f} ms over {runs} runs (min {min(timings):.0f}, max {max(timings):.0f}), "
+          f"budget {budget_ms:.0f} ms")
+    if loaded:
+        raise click.ClickException(f"Startup imported {', '.join(sorted(loaded))}; import it where it is used")
+    if median > budget_ms:
+        raise click.ClickException('Startup is over budget')
+
+@bp.cli.command('rebuild-low-stock')
+def rebuild_low_stock_command():
+    """Recompute the low-stock set from inventory."""
+    print(f'{rebuild_low_stock()} low-stock items')
+
+@bp.cli.command('forecast-reorders')
+def forecast_reorders_command():
+    """Forecast demand and refresh the reorder suggestions."""
+    print(f'{compute_reorder_suggestions()} reorder suggestions')
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the sales rollup tables from all transactions."""
+    print(f'Rolled up {rebuild_sales_rollups()} transactions')
+
+@bp.route('/users')
+@login_required
+def users():
+    if current_user.role != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('pos.index'))
+
+    users = User.query.all()
+    return render_template('users.html', users=users)
+
+@bp.route('/user/add', methods=['GET', 'POST'])
+@login_required
+def add_user():
+    if current_user.role != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('admin.users'))
+
+    form = UserForm()
+    form.branch_id.choices = [(0, 'No Branch')] + [(b.id, b.name) for b in Branch.query.filter_by(is_active=True).all()]
+
+    if form.validate_on_submit():
+        # Check if username or email already exists
+        existing_user = User.query.filter(
+            db.or_(
+                User.username == form.username.data,
+                User.email == form.email.data
+            )
+        ).first()
+        if existing_user:
+            flash('Username or email already exists', 'error')
+            return render_template('user_form.html', form=form, title='Add User')
+
+        user = User(
+            username=form.username.data,
+            email=form.email.data,
+            password_hash=generate_password_hash(form.password.data),
+            role=form.role.data,
+            branch_id=form.branch_id.data if form.branch_id.data != 0 else None
+        )
+
+        db.session.add(user)
+        db.session.commit()
+
+        flash('User added successfully', 'success')
+        return redirect(url_for('admin.users'))
+
+    return render_template('user_form.html', form=form, title='Add User')
+
+@bp.route('/branches')
+@login_required
+def branches():
+    if current_user.role not in ['admin', 'manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('pos.index'))
+
+    branches = Branch.query.all()
+    return render_template('branches.html', branches=branches)
+
+@bp.route('/branch/add', methods=['GET', 'POST'])
+@login_required
+def add_branch():
+    if current_user.role not in ['admin', 'manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('admin.branches'))
+
+    form = BranchForm()
+
+    if form.validate_on_submit():
+        branch = Branch(
+            name=form.name.data,
+            address=form.address.data,
+            phone=form.phone.data
+        )
+
+        db.session.add(branch)
+        db.session.commit()
+
+        flash('Branch added successfully', 'success')
+        return redirect(url_for('admin.branches'))
+
+    return render_template('branch_form.html', form=form, title='Add Branch')
+
+@bp.route('/reports')
+@login_required
+def reports():
+    branches = Branch.query.filter_by(is_active=True).all()
+    try:
+        report, branch_id, date_from, date_to = report_request_args(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        report, branch_id = 'sales', None
+        date_from, date_to = parse_report_range(None, None)
+
+    result = run_report(report, branch_id, date_from, date_to) if 'report' in request.args else None
+    summary = run_report('summary', branch_id, date_from, date_to)['rows'][0]
+
+    return render_template('reports.html',
+                         report_types=REPORT_TYPES,
+                         branches=branches,
+                         report=report,
+                         branch_id=branch_id,
+                         date_from=date_from,
+                         date_to=date_to,
+                         summary=summary,
+                         result=result)
+
+@bp.route('/api/reports/<report>')
+@login_required
+def report_api(report):
+    try:
+        report, branch_id, date_from, date_to = report_request_args(request.args, report)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'summary': run_report('summary', branch_id, date_from, date_to)['rows'][0],
+        **run_report(report, branch_id, date_from, date_to)
+    })
+
+@bp.route('/export/<name>')
+@login_required
+def export_data(name):
+    if current_user.role not in ['admin', 'manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('admin.reports'))
+
+    export_format = request.args.get('format', 'csv')
+    if name not in EXPORTS or export_format not in EXPORT_FORMATS:
+        flash('Unknown export', 'error')
+        return redirect(url_for('admin.reports'))
+    try:
+        date_from, date_to = parse_report_range(request.args.get('date_from'), request.args.get('date_to'))
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.reports'))
+    branch_id = request.args.get('branch', type=int) or None
+
+    start, end = day_bounds(date_from, date_to)
+    header, query = EXPORTS[name](branch_id, start, end)
+    rows = stream_rows(query)
+    filename = f'{name}_{date_from.isoformat()}_{date_to.isoformat()}.{export_format}'
+
+    if export_format == 'csv':
+        body = csv_chunks(header, rows)
+        mimetype = 'text/csv'
+    else:
+        body = xlsx_chunks(name, header, rows)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/api/admin/cache_stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    return jsonify({
+        'product_cache': product_cache.stats(),
+        'search_index': {'size': len(product_search_index), 'version': search_index_state['version']}
+    })
+
+@bp.route('/api/admin/maintenance')
+@login_required
+def maintenance_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    return jsonify({'held_transactions': held_maintenance_stats()})
+
+@bp.route('/api/admin/storage')
+@login_required
+def storage_stats():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    report = storage_report(db.engine, current_app.config)
+    report['group_commit'] = dict(current_app.extensions['group_commit_writer'].stats(), enabled=current_app.config['GROUP_COMMIT'])
+    return jsonify(report)
+
+@bp.route('/metrics')
+def metrics():
+    # Scrapers send the configured token; people sign in as an admin
+    token = current_app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())):
+        if not current_user.is_authenticated or current_user.role != 'admin':
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    profiler = current_app.extensions.get('request_profiler')
+    if profiler is None:
+        return jsonify({'success': False, 'message': 'Profiling is disabled'}), 404
+    return Response(profiler.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/admin/stock_drift')
+@login_required
+def stock_drift():
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    drift = reconcile_stock(full=request.args.get('full', 'false').lower() == 'true')
+    return jsonify({'success': True, 'count': len(drift), 'drift': drift[:current_app.config['REPORT_MAX_ROWS']]})
+
+@bp.route('/settings')
+@login_required
+def settings():
+    if current_user.role != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('pos.index'))
+
+    return render_template('settings.html', held_stats=held_maintenance_stats())
@@ -0,0 +1,427 @@
+"""
+Products and categories, catalog import and export, and the product APIs used by terminals.
+"""
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from flask_login import login_required, current_user
+from datetime import datetime
+import json
+from pagination import InvalidCursor
+from extensions import db
+from models import Branch, Category, Product, ProductBarcode, Inventory, normalize_barcodes
+from forms import ProductForm, CategoryForm
+from helpers import (
+    current_version, barcode_conflicts, CATALOG_FIELDS, catalog_rows, catalog_categories, get_product_records,
+    get_product_record_by_sku, search_product_ids, ranked_product_ids, touch_category_products, paginate_keyset,
+    paginate_ranked, product_list_page, refresh_low_stock, iter_upload_rows, CATALOG_COLUMNS, import_catalog,
+    export_catalog_query, catalog_export_rows, EXPORT_FORMATS, stream_rows, csv_chunks, xlsx_chunks
+)
+
+bp = Blueprint('catalog', __name__)
+
+@bp.route('/products')
+@login_required
+def products():
+    per_page = 20
+    search = request.args.get('search', '')
+
+    query = Product.query.filter_by(is_active=True)
+
+    if search:
+        # Every match in rank order, with the real total
+        products = paginate_ranked(query, Product.id, ranked_product_ids(search), per_page)
+    else:
+        products = paginate_keyset(query, [Product.created_at, Product.id], per_page, descending=True)
+    categories = Category.query.filter_by(is_active=True).all()
+
+    return render_template('products.html',
+                         products=products,
+                         categories=categories,
+                         search=search)
+
+@bp.route('/products/import', methods=['GET', 'POST'])
+@login_required
+def import_products():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('catalog.products'))
+
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        apply = request.form.get('validate_only') != 'true'
+        if not upload or not upload.filename:
+            flash('Choose a catalog file to upload', 'error')
+            return redirect(url_for('catalog.import_products'))
+        try:
+            result = import_catalog(iter_upload_rows(upload), apply=apply)
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('catalog.import_products'))
+        if apply:
+            flash(f"Catalog imported: {result['created']} products created, {len(result['errors'])} lines with errors",
+                  'warning' if result['errors'] else 'success')
+
+    return render_template('catalog_import.html', columns=CATALOG_COLUMNS, result=result)
+
+@bp.route('/products/export')
+@login_required
+def export_products():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('catalog.products'))
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash('Unknown export', 'error')
+        return redirect(url_for('catalog.products'))
+
+    rows = catalog_export_rows(stream_rows(export_catalog_query()))
+    filename = f"catalog_{datetime.now().strftime('%Y-%m-%d')}.{export_format}"
+
+    if export_format == 'csv':
+        body = csv_chunks(CATALOG_COLUMNS, rows)
+        mimetype = 'text/csv'
+    else:
+        body = xlsx_chunks('catalog', CATALOG_COLUMNS, rows)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/product/add', methods=['GET', 'POST'])
+@login_required
+def add_product():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('catalog.products'))
+
+    form = ProductForm()
+    form.category_id.choices = [(0, 'No Category')] + [(c.id, c.name) for c in Category.query.filter_by(is_active=True).all()]
+
+    if form.validate_on_submit():
+        # Check if SKU already exists
+        existing_product = Product.query.filter_by(sku=form.sku.data).first()
+        if existing_product:
+            print(f"SKU {form.sku.data} already exists")
+            flash('SKU already exists', 'error')
+            return render_template('product_form.html', form=form, title='Add Product')
+
+        # Handle multiple barcodes
+        barcodes = request.form.get('barcodes')
+        if barcodes:
+            try:
+                barcode_list = json.loads(barcodes)
+            except:
+                barcode_list = []
+        else:
+            barcode_list = []
+
+        # Check barcodes are not assigned to another product
+        conflicts = barcode_conflicts(normalize_barcodes(barcode_list))
+        if conflicts:
+            flash(f"Barcode already assigned to another product: {', '.join(conflicts)}", 'error')
+            return render_template('product_form.html', form=form, title='Add Product')
+
+        # Handle expiry date
+        expiry_date = None
+        if form.expiry_date.data:
+            try:
+                expiry_date = datetime.strptime(form.expiry_date.data, '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid expiry date format. Use YYYY-MM-DD', 'error')
+                return render_template('product_form.html', form=form, title='Add Product')
+
+        product = Product(
+            name=form.name.data,
+            description=form.description.data,
+            sku=form.sku.data,
+            category_id=form.category_id.data if form.category_id.data != 0 else None,
+            price=form.price.data,
+            cost_price=form.cost_price.data,
+            min_stock=form.min_stock.data,
+            max_stock=form.max_stock.data,
+            box_qty=form.box_qty.data,
+            is_favorite=form.is_favorite.data == 'True',
+            expiry_date=expiry_date
+        )
+        product.barcode_list = barcode_list
+
+        db.session.add(product)
+        db.session.commit()
+
+        # Create inventory entries for all branches
+        branches = Branch.query.filter_by(is_active=True).all()
+        for branch in branches:
+            inventory = Inventory(
+                product_id=product.id,
+                branch_id=branch.id,
+                quantity=0
+            )
+            db.session.add(inventory)
+
+        refresh_low_stock([product.id])
+        db.session.commit()
+
+        flash('Product added successfully', 'success')
+        return redirect(url_for('catalog.products'))
+
+    return render_template('product_form.html', form=form, title='Add Product')
+
+@bp.route('/product/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_product(id):
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('catalog.products'))
+
+    product = Product.query.get_or_404(id)
+    form = ProductForm(obj=product)
+    form.category_id.choices = [(0, 'No Category')] + [(c.id, c.name) for c in Category.query.filter_by(is_active=True).all()]
+
+    if form.validate_on_submit():
+        # Check if SKU already exists (excluding current product)
+        existing_product = Product.query.filter(
+            Product.sku == form.sku.data,
+            Product.id != id
+        ).first()
+        if existing_product:
+            flash('SKU already exists', 'error')
+            return render_template('product_form.html', form=form, title='Edit Product', product=product)
+
+        # Handle multiple barcodes
+        barcodes = request.form.get('barcodes')
+        if barcodes:
+            try:
+                barcode_list = json.loads(barcodes)
+            except:
+                barcode_list = []
+        else:
+            barcode_list = []
+
+        # Check barcodes are not assigned to another product
+        conflicts = barcode_conflicts(normalize_barcodes(barcode_list), product_id=id)
+        if conflicts:
+            flash(f"Barcode already assigned to another product: {', '.join(conflicts)}", 'error')
+            return render_template('product_form.html', form=form, title='Edit Product', product=product)
+
+        # Handle expiry date
+        expiry_date = None
+        if form.expiry_date.data:
+            try:
+                expiry_date = datetime.strptime(form.expiry_date.data, '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid expiry date format. Use YYYY-MM-DD', 'error')
+                return render_template('product_form.html', form=form, title='Edit Product', product=product)
+
+        product.name = form.name.data
+        product.description = form.description.data
+        product.sku = form.sku.data
+        product.barcode_list = barcode_list
+        product.category_id = form.category_id.data if form.category_id.data != 0 else None
+        product.price = form.price.data
+        product.cost_price = form.cost_price.data
+        product.min_stock = form.min_stock.data
+        product.max_stock = form.max_stock.data
+        product.box_qty = form.box_qty.data
+        product.is_favorite = form.is_favorite.data == 'True'
+        product.expiry_date = expiry_date
+        product.updated_at = datetime.utcnow()
+
+        refresh_low_stock([product.id])
+        db.session.commit()
+
+        flash('Product updated successfully', 'success')
+        return redirect(url_for('catalog.products'))
+
+    return render_template('product_form.html', form=form, title='Edit Product', product=product)
+
+@bp.route('/product/delete/<int:id>', methods=['POST'])
+@login_required
+def delete_product(id):
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    product = Product.query.get_or_404(id)
+    product.is_active = False
+    refresh_low_stock([product.id])
+    db.session.commit()
+
+    return jsonify({'success': True, 'message': 'Product deleted successfully'})
+
+@bp.route('/categories')
+@login_required
+def categories():
+    categories = Category.query.filter_by(is_active=True).all()
+    return render_template('categories.html', categories=categories)
+
+@bp.route('/category/add', methods=['GET', 'POST'])
+@login_required
+def add_category():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('catalog.categories'))
+
+    form = CategoryForm()
+    categories = Category.query.filter_by(is_active=True).all()
+    form.parent_id.choices = [(0, 'No Parent')] + [(c.id, c.name) for c in categories]
+
+    if form.validate_on_submit():
+        category = Category(
+            name=form.name.data,
+            description=form.description.data,
+            parent_id=form.parent_id.data if form.parent_id.data != 0 else None
+        )
+
+        db.session.add(category)
+        db.session.commit()
+
+        flash('Category added successfully', 'success')
+        return redirect(url_for('catalog.categories'))
+
+    return render_template('category_form.html', form=form, title='Add Category')
+
+@bp.route('/category/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_category(id):
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('catalog.categories'))
+
+    category = Category.query.get_or_404(id)
+    form = CategoryForm(obj=category)
+    categories = Category.query.filter_by(is_active=True).all()
+    form.parent_id.choices = [(0, 'No Parent')] + [(c.id, c.name) for c in categories if c.id != id]
+
+    if form.validate_on_submit():
+        category.name = form.name.data
+        category.description = form.description.data
+        category.parent_id = form.parent_id.data if form.parent_id.data != 0 else None
+        touch_category_products(category.id)
+
+        db.session.commit()
+
+        flash('Category updated successfully', 'success')
+        return redirect(url_for('catalog.categories'))
+
+    return render_template('category_form.html', form=form, title='Edit Category', category=category)
+
+@bp.route('/category/delete/<int:id>', methods=['POST'])
+@login_required
+def delete_category(id):
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    category = Category.query.get_or_404(id)
+    category.is_active = False
+    db.session.commit()
+
+    return jsonify({'success': True, 'message': 'Category deleted successfully'})
+
+@bp.route('/api/products/search')
+@login_required
+def search_products():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify([])
+
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    ids = search_product_ids(query, limit=limit)
+    records = get_product_records(ids)
+
+    results = []
+    for product_id in ids:
+        product = records.get(product_id)
+        if not product or not product['is_active']:
+            continue
+        results.append({
+            'id': product['id'],
+            'name': product['name'],
+            'sku': product['sku'],
+            'price': product['price'],
+            'cost_price': product['cost_price'] or product['price'],
+            'box_qty': product['box_qty']
+        })
+
+    return jsonify(results)
+
+@bp.route('/api/products/by_barcode/<code>')
+@login_required
+def product_by_barcode(code):
+    code = code.strip()
+    # Scanned or typed codes may be an active product's SKU, which wins as in
+    # imports and is usually served from the product cache; otherwise look
+    # up the barcode
+    barcode = None
+    product = get_product_record_by_sku(code)
+    if product is None or not product['is_active']:
+        product_id = db.session.query(ProductBarcode.product_id).filter(ProductBarcode.barcode == code).scalar()
+        product = get_product_records([product_id]).get(product_id) if product_id else None
+        barcode = code
+
+    if not product or not product['is_active']:
+        return jsonify({'success': False, 'message': 'Product not found'}), 404
+
+    return jsonify({
+        'id': product['id'],
+        'name': product['name'],
+        'sku': product['sku'],
+        'barcode': barcode,  # None when the code matched the SKU
+        'price': product['price'],
+        'cost_price': product['cost_price'] or product['price'],
+        'box_qty': product['box_qty']
+    })
+
+@bp.route('/api/products/list')
+@login_required
+def products_list():
+    cursor = request.args.get('cursor')
+    per_page = 50  # Load more products for modal
+    search = request.args.get('search', '')
+    category_filter = request.args.get('category', '')
+
+    try:
+        return jsonify(product_list_page(cursor, per_page, search, category_filter))
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+@bp.route('/api/catalog/snapshot')
+@login_required
+def catalog_snapshot():
+    # Read the version first: rows changed meanwhile are simply sent again
+    version = current_version('catalog')
+
+    return jsonify({
+        'version': version,
+        'fields': CATALOG_FIELDS,
+        'products': catalog_rows(Product.query.filter_by(is_active=True)),
+        'categories': catalog_categories()
+    })
+
+@bp.route('/api/catalog/changes')
+@login_required
+def catalog_changes():
+    since = request.args.get('since', 0, type=int)
+    version = current_version('catalog')
+
+    # A version from the future means the server was reset
+    if since > version:
+        return jsonify({'version': version, 'full_resync': True})
+
+    changed = Product.query.filter(Product.catalog_version > since)
+    removed = [row.id for row in changed.filter(Product.is_active == False).with_entities(Product.id)]
+
+    return jsonify({
+        'version': version,
+        'full_resync': False,
+        'fields': CATALOG_FIELDS,
+        'products': catalog_rows(changed.filter(Product.is_active == True)),
+        'removed': removed,
+        'categories': catalog_categories()
+    })
@@ -0,0 +1,236 @@
+"""
+Stock levels, stock takes, transfers, movements and reorder suggestions.
+"""
+
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
+from extensions import db
+from models import Branch, Product, Inventory, ProductMovement, MaintenanceRun, LowStockItem, ReorderSuggestion
+from helpers import (
+    paginate_keyset, InsufficientStockError, stock_shortages, apply_stock_deltas, ensure_inventory_rows, chunked,
+    iter_upload_rows, resolve_product_codes, import_stock_take, transfer_stock
+)
+
+bp = Blueprint('inventory', __name__)
+
+@bp.route('/inventory')
+@login_required
+def inventory():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('pos.index'))
+
+    per_page = 20
+    search = request.args.get('search', '')
+    branch_filter = request.args.get('branch', '')
+
+    # Base query joining Product and Inventory
+    query = db.session.query(Product, Inventory).join(Inventory).filter(Product.is_active == True)
+
+    if search:
+        query = query.filter(
+            db.or_(
+                Product.name.contains(search),
+                Product.sku.contains(search)
+            )
+        )
+
+    if branch_filter:
+        query = query.filter(Inventory.branch_id == branch_filter)
+
+    # Page by product name
+    results = paginate_keyset(query, [Product.name, Inventory.id], per_page,
+                              key_func=lambda row: (row.Product.name, row.Inventory.id))
+
+    # Get branches for filter
+    branches = Branch.query.filter_by(is_active=True).all()
+
+    # Low stock items come from the maintained low-stock set, a page at a time
+    low_stock_query = db.session.query(Product, Inventory).join(
+        LowStockItem, LowStockItem.product_id == Product.id
+    ).join(
+        Inventory, db.and_(Inventory.product_id == LowStockItem.product_id,
+                           Inventory.branch_id == LowStockItem.branch_id)
+    )
+    if branch_filter:
+        low_stock_query = low_stock_query.filter(LowStockItem.branch_id == branch_filter)
+    low_stock_items = paginate_keyset(
+        low_stock_query, [Product.name, LowStockItem.product_id, LowStockItem.branch_id], 6,
+        key_func=lambda row: (row.Product.name, row.Inventory.product_id, row.Inventory.branch_id),
+        cursor_arg='low_cursor'
+    )
+
+    return render_template('inventory.html',
+                          results=results,
+                          branches=branches,
+                          search=search,
+                          branch_filter=branch_filter,
+                          low_stock_items=low_stock_items)
+
+@bp.route('/inventory/stock_take', methods=['GET', 'POST'])
+@login_required
+def stock_take():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('pos.index'))
+
+    branches = Branch.query.filter_by(is_active=True).all()
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        branch_id = request.form.get('branch_id', type=int) or current_user.branch_id or 1
+        apply = request.form.get('validate_only') != 'true'
+        if not upload or not upload.filename:
+            flash('Choose a count sheet to upload', 'error')
+            return redirect(url_for('inventory.stock_take'))
+        try:
+            result = import_stock_take(iter_upload_rows(upload), branch_id, current_user.id, apply=apply)
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('inventory.stock_take'))
+        if apply:
+            flash(f"Stock take applied: {result['adjusted']} products adjusted, {len(result['errors'])} lines with errors",
+                  'warning' if result['errors'] else 'success')
+
+    return render_template('stock_take.html', branches=branches, result=result)
+
+@bp.route('/api/inventory/transfer', methods=['POST'])
+@login_required
+def create_transfer():
+    """Move many products from one branch to another in a single transaction.
+
+    Lines give ``product_id`` or ``sku`` and a positive ``quantity``; lines
+    for the same product are added together.
+    """
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    data = request.get_json() or {}
+    from_branch_id = data.get('from_branch_id')
+    to_branch_id = data.get('to_branch_id')
+    lines = data.get('lines', [])
+
+    if not from_branch_id or not to_branch_id or from_branch_id == to_branch_id:
+        return jsonify({'success': False, 'message': 'Choose two different branches'}), 400
+    if Branch.query.filter(Branch.id.in_([from_branch_id, to_branch_id])).count() != 2:
+        return jsonify({'success': False, 'message': 'Unknown branch'}), 400
+    if not lines:
+        return jsonify({'success': False, 'message': 'No lines to transfer'}), 400
+    if len(lines) > current_app.config['TRANSFER_MAX_LINES']:
+        return jsonify({'success': False, 'message': f"At most {current_app.config['TRANSFER_MAX_LINES']} lines per transfer"}), 400
+
+    resolved = resolve_product_codes(str(line['sku']) for line in lines if line.get('sku') and not line.get('product_id'))
+    known_ids = set()
+    for batch in chunked({line['product_id'] for line in lines if isinstance(line.get('product_id'), int)}):
+        known_ids.update(product_id for product_id, in db.session.query(Product.id).filter(Product.id.in_(batch)))
+    known_ids.update(resolved.values())
+
+    errors = []
+    quantities = {}
+    for index, line in enumerate(lines):
+        product_id = line.get('product_id') or resolved.get(str(line.get('sku')))
+        quantity = line.get('quantity')
+        if product_id not in known_ids:
+            errors.append({'index': index, 'message': 'Unknown product'})
+        elif not isinstance(quantity, int) or quantity <= 0:
+            errors.append({'index': index, 'message': 'Quantity must be a positive whole number'})
+        else:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if errors:
+        return jsonify({'success': False, 'message': 'Invalid lines in transfer', 'errors': errors}), 400
+
+    try:
+        transfer_number = transfer_stock(from_branch_id, to_branch_id, quantities, current_user.id, data.get('notes', ''))
+        db.session.commit()
+    except InsufficientStockError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': 'Insufficient stock at the source branch',
+            'shortages': stock_shortages(e.branch_id, e.requested)
+        }), 409
+
+    return jsonify({
+        'success': True,
+        'transfer_number': transfer_number,
+        'products': len(quantities),
+        'units': sum(quantities.values()),
+        'message': 'Transfer completed successfully'
+    })
+
+@bp.route('/reorder_suggestions')
+@login_required
+def reorder_suggestions():
+    if current_user.role not in ['admin', 'manager', 'inventory_manager']:
+        flash('Access denied', 'error')
+        return redirect(url_for('pos.index'))
+
+    branch_filter = request.args.get('branch', '')
+
+    query = ReorderSuggestion.query.options(
+        db.joinedload(ReorderSuggestion.product), db.joinedload(ReorderSuggestion.branch)
+    )
+    if branch_filter:
+        query = query.filter(ReorderSuggestion.branch_id == branch_filter)
+    # Most urgent first; products with no demand (no cover figure) last. The
+    # cover key is coalesced so NULLs compare inside the cursor's row value
+    no_demand = db.case((ReorderSuggestion.days_of_cover.is_(None), 1), else_=0)
+    suggestions = paginate_keyset(
+        query,
+        [no_demand, db.func.coalesce(ReorderSuggestion.days_of_cover, 0), ReorderSuggestion.product_id,
+         ReorderSuggestion.branch_id],
+        50,
+        key_func=lambda row: (
+            1 if row.days_of_cover is None else 0, row.days_of_cover or 0, row.product_id, row.branch_id
+        )
+    )
+
+    return render_template('reorder_suggestions.html',
+                          suggestions=suggestions,
+                          branches=Branch.query.filter_by(is_active=True).all(),
+                          branch_filter=branch_filter,
+                          last_run=db.session.get(MaintenanceRun, 'forecast'))
+
+@bp.route('/product/<int:id>/movements')
+@login_required
+def product_movements(id):
+    product = Product.query.get_or_404(id)
+    per_page = 20
+    movements = paginate_keyset(ProductMovement.query.filter_by(product_id=id),
+                                [ProductMovement.created_at, ProductMovement.id], per_page, descending=True)
+    return render_template('product_movements.html', product=product, movements=movements)
+
+@bp.route('/product/<int:id>/add_movement', methods=['GET', 'POST'])
+@login_required
+def add_product_movement(id):
+    product = Product.query.get_or_404(id)
+    if request.method == 'POST':
+        movement_type = request.form.get('movement_type')
+        quantity = int(request.form.get('quantity'))
+        reason = request.form.get('reason')
+        notes = request.form.get('notes')
+        branch_id = current_user.branch_id or 1
+
+        movement = ProductMovement(
+            product_id=id,
+            branch_id=branch_id,
+            movement_type=movement_type,
+            quantity=quantity,
+            user_id=current_user.id,
+            reason=reason,
+            notes=notes
+        )
+        db.session.add(movement)
+
+        # Update inventory, creating the branch row on first movement so the
+        # movement is never dropped; apply_stock_deltas subtracts
+        ensure_inventory_rows(branch_id, [id])
+        apply_stock_deltas(branch_id, {id: -quantity})
+        db.session.commit()
+
+        flash('Movement added successfully', 'success')
+        return redirect(url_for('inventory.product_movements', id=id))
+
+    return render_template('add_movement.html', product=product)
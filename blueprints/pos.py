@@ -0,0 +1,462 @@
+"""
+Point of sale: the dashboard, login, the sales screen, held transactions, receipts and customers.
+"""
+
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, Response
+from sqlalchemy.exc import IntegrityError
+from flask_login import login_user, login_required, logout_user, current_user
+from werkzeug.security import check_password_hash
+from datetime import datetime, timezone
+import json
+import queue
+import time
+import uuid
+from extensions import db
+from models import User, Customer, SalesRollup, HeldTransaction, SupportTicket, LowStockItem
+from forms import LoginForm, CustomerForm
+from helpers import (
+    held_count, adjust_held_count, held_count_broker, run_write, paginate_keyset, InsufficientStockError,
+    stock_shortages, apply_stock_deltas, new_sale_id, sale_totals, find_submitted_sales, record_sale,
+    SalesRollupDelta, prerender_receipt, receipt_response
+)
+
+bp = Blueprint('pos', __name__)
+
+# Routes
+@bp.route('/')
+@login_required
+def index():
+    # Dashboard with quick stats, read from the hourly rollup
+    total_sales, total_transactions = db.session.query(
+        db.func.sum(SalesRollup.total_amount),
+        db.func.sum(SalesRollup.transaction_count)
+    ).filter(SalesRollup.day == datetime.utcnow().date()).one()
+    total_sales = total_sales or 0
+    total_transactions = total_transactions or 0
+
+    low_stock_products = LowStockItem.query.count()
+
+    # held_transactions_count comes from the context processor
+    return render_template('dashboard.html',
+                         total_sales=total_sales,
+                         total_transactions=total_transactions,
+                         low_stock_products=low_stock_products)
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('pos.index'))
+
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=form.username.data).first()
+        if user and check_password_hash(user.password_hash, form.password.data):
+            login_user(user)
+            user.last_login = datetime.utcnow()
+            db.session.commit()
+            next_page = request.args.get('next')
+            return redirect(next_page) if next_page else redirect(url_for('pos.index'))
+        else:
+            flash('Invalid username or password', 'error')
+
+    return render_template('login.html', form=form)
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('pos.login'))
+
+@bp.route('/pos')
+@login_required
+def pos():
+    search = request.args.get('search', '').strip()
+
+    # Products and customers are not embedded; the page fetches them from the
+    # catalog sync and customer search APIs
+    held_transactions = HeldTransaction.query.filter(
+        HeldTransaction.user_id == current_user.id,
+        HeldTransaction.expires_at > datetime.utcnow()
+    ).all()
+
+    held_transactions_count = len(held_transactions)
+
+    return render_template('pos.html',
+                          held_transactions=held_transactions,
+                          held_transactions_count=held_transactions_count,
+                          search=search)
+
+def hold_cart(transaction_id, user_id, branch_id, cart_data, customer_data=None, notes=''):
+    """Add a held transaction to the session and count it; the caller owns the commit"""
+    db.session.add(HeldTransaction(
+        transaction_id=transaction_id,
+        user_id=user_id,
+        branch_id=branch_id,
+        cart_data=json.dumps(cart_data),
+        customer_data=json.dumps(customer_data) if customer_data else None,
+        notes=notes
+    ))
+    db.session.flush()
+    adjust_held_count(user_id, 1)
+
+@bp.route('/api/hold_transaction', methods=['POST'])
+@login_required
+def hold_transaction():
+    data = request.get_json()
+    cart_data = data.get('cart', [])
+    customer_data = data.get('customer', {})
+    notes = data.get('notes', '')
+
+    if not cart_data:
+        return jsonify({'success': False, 'message': 'Cart is empty'}), 400
+
+    # Generate unique transaction ID
+    transaction_id = f"HLD{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+
+    run_write(
+        hold_cart,
+        transaction_id=transaction_id,
+        user_id=current_user.id,
+        branch_id=current_user.branch_id or 1,
+        cart_data=cart_data,
+        customer_data=customer_data,
+        notes=notes
+    )
+    held_count_broker.publish(current_user.id, held_count(current_user.id))
+
+    return jsonify({
+        'success': True,
+        'transaction_id': transaction_id,
+        'message': 'Transaction held successfully'
+    })
+
+@bp.route('/api/resume_transaction/<transaction_id>', methods=['POST'])
+@login_required
+def resume_transaction(transaction_id):
+    held_transaction = HeldTransaction.query.filter_by(
+        transaction_id=transaction_id,
+        user_id=current_user.id
+    ).first()
+
+    if not held_transaction:
+        return jsonify({'success': False, 'message': 'Transaction not found'}), 404
+
+    cart_data = json.loads(held_transaction.cart_data)
+    customer_data = json.loads(held_transaction.customer_data) if held_transaction.customer_data else {}
+
+    # Delete the held transaction
+    db.session.delete(held_transaction)
+    adjust_held_count(current_user.id, -1)
+    db.session.commit()
+    held_count_broker.publish(current_user.id, held_count(current_user.id))
+
+    return jsonify({
+        'success': True,
+        'cart': cart_data,
+        'customer': customer_data,
+        'message': 'Transaction resumed successfully'
+    })
+
+@bp.route('/api/delete_held_transaction/<transaction_id>', methods=['DELETE'])
+@login_required
+def delete_held_transaction(transaction_id):
+    held_transaction = HeldTransaction.query.filter_by(
+        transaction_id=transaction_id,
+        user_id=current_user.id
+    ).first()
+
+    if not held_transaction:
+        return jsonify({'success': False, 'message': 'Transaction not found'}), 404
+
+    db.session.delete(held_transaction)
+    adjust_held_count(current_user.id, -1)
+    db.session.commit()
+    held_count_broker.publish(current_user.id, held_count(current_user.id))
+
+    return jsonify({'success': True, 'message': 'Transaction deleted successfully'})
+
+@bp.route('/api/held_transactions_count')
+@login_required
+def held_transactions_count():
+    return jsonify({'count': held_count(current_user.id)})
+
+@bp.route('/api/held_transactions/stream')
+@login_required
+def held_transactions_stream():
+    """Server-Sent Events stream of the current user's held transaction count"""
+    user_id = current_user.id
+    subscriber = held_count_broker.subscribe(user_id)
+    initial_count = held_count(user_id)
+    stream_seconds = current_app.config['HELD_EVENTS_STREAM_SECONDS']
+    # The stream is long-lived; do not hold a database connection for it
+    db.session.remove()
+
+    def event(count):
+        return f"event: held_count\ndata: {json.dumps({'count': count})}\n\n"
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            yield event(initial_count)
+            last_count = initial_count
+            # End the stream now and then so workers are recycled; EventSource reconnects
+            deadline = time.monotonic() + stream_seconds
+            while time.monotonic() < deadline:
+                try:
+                    count = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if count != last_count:
+                    last_count = count
+                    yield event(count)
+        finally:
+            held_count_broker.unsubscribe(user_id, subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@bp.route('/api/complete_sale', methods=['POST'])
+@login_required
+def complete_sale():
+    data = request.get_json()
+    cart = data.get('cart', [])
+    customer_id = data.get('customer_id')
+    payment_method = data.get('payment_method', 'cash')
+    amount_received = data.get('amount_received', 0)
+    notes = data.get('notes', '')
+    idempotency_key = data.get('idempotency_key')
+
+    if not cart:
+        return jsonify({'success': False, 'message': 'Cart is empty'}), 400
+
+    # A retried submission returns the sale recorded the first time
+    if idempotency_key:
+        existing = find_submitted_sales([idempotency_key]).get(idempotency_key)
+        if existing:
+            return jsonify({'success': True, 'duplicate': True, 'message': 'Sale already recorded', **existing})
+
+    # Calculate totals
+    total_amount, tax_amount, discount_amount = sale_totals(cart)
+
+    # Generate unique transaction ID
+    transaction_id = new_sale_id()
+
+    try:
+        run_write(
+            record_sale,
+            transaction_id=transaction_id,
+            cart=cart,
+            user_id=current_user.id,
+            branch_id=current_user.branch_id or 1,
+            customer_id=customer_id,
+            payment_method=payment_method,
+            total_amount=total_amount,
+            tax_amount=tax_amount,
+            discount_amount=discount_amount,
+            notes=notes,
+            idempotency_key=idempotency_key
+        )
+    except InsufficientStockError as e:
+        return jsonify({
+            'success': False,
+            'message': 'Insufficient stock',
+            'shortages': stock_shortages(e.branch_id, e.requested)
+        }), 409
+    except IntegrityError:
+        # The same idempotency key was committed concurrently
+        existing = find_submitted_sales([idempotency_key]).get(idempotency_key) if idempotency_key else None
+        if not existing:
+            raise
+        return jsonify({'success': True, 'duplicate': True, 'message': 'Sale already recorded', **existing})
+
+    prerender_receipt(transaction_id)
+
+    return jsonify({
+        'success': True,
+        'transaction_id': transaction_id,
+        'total': total_amount,
+        'receipt_url': url_for('pos.receipt_pdf', transaction_id=transaction_id),
+        'message': 'Sale completed successfully'
+    })
+
+def offline_sale_time(value):
+    """Parse an offline sale's ISO 8601 time as naive UTC, the way created_at is stored"""
+    created_at = datetime.fromisoformat(value)
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return created_at
+
+@bp.route('/api/complete_sales/batch', methods=['POST'])
+@login_required
+def complete_sales_batch():
+    """Record sales queued by an offline terminal in one database transaction.
+
+    Each sale carries a client-generated ``idempotency_key``; keys already
+    recorded are reported as duplicates and skipped, so a terminal can
+    safely resend a batch after a dropped connection. Offline sales have
+    already happened, so stock is allowed to go negative here.
+    """
+    data = request.get_json() or {}
+    sales = data.get('sales', [])
+    branch_id = current_user.branch_id or 1
+
+    if not sales:
+        return jsonify({'success': False, 'message': 'No sales submitted'}), 400
+    if len(sales) > current_app.config['SALE_BATCH_MAX']:
+        return jsonify({'success': False, 'message': f"At most {current_app.config['SALE_BATCH_MAX']} sales per batch"}), 400
+
+    errors = []
+    for index, sale in enumerate(sales):
+        key = sale.get('idempotency_key')
+        if not key or not isinstance(key, str) or len(key) > 64:
+            errors.append({'index': index, 'message': 'idempotency_key is required (max 64 characters)'})
+        elif not sale.get('cart'):
+            errors.append({'index': index, 'idempotency_key': key, 'message': 'Cart is empty'})
+        elif sale.get('created_at'):
+            try:
+                offline_sale_time(sale['created_at'])
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'idempotency_key': key, 'message': 'Invalid created_at'})
+    if errors:
+        return jsonify({'success': False, 'message': 'Invalid sales in batch', 'errors': errors}), 400
+
+    existing = find_submitted_sales({sale['idempotency_key'] for sale in sales})
+    results = []
+    stock_deltas = {}
+    rollup = SalesRollupDelta()
+
+    try:
+        for sale in sales:
+            key = sale['idempotency_key']
+            if key in existing:
+                results.append({'idempotency_key': key, 'status': 'duplicate', **existing[key]})
+                continue
+
+            total_amount, tax_amount, discount_amount = sale_totals(sale['cart'])
+            transaction_id = new_sale_id()
+            record_sale(
+                transaction_id=transaction_id,
+                cart=sale['cart'],
+                user_id=current_user.id,
+                branch_id=branch_id,
+                customer_id=sale.get('customer_id'),
+                payment_method=sale.get('payment_method', 'cash'),
+                total_amount=total_amount,
+                tax_amount=tax_amount,
+                discount_amount=discount_amount,
+                notes=sale.get('notes', ''),
+                created_at=offline_sale_time(sale['created_at']) if sale.get('created_at') else None,
+                idempotency_key=key,
+                stock_deltas=stock_deltas,
+                rollup=rollup
+            )
+            # A key repeated inside the batch is a replay of this sale
+            existing[key] = {'transaction_id': transaction_id, 'total': total_amount}
+            results.append({'idempotency_key': key, 'status': 'created', **existing[key]})
+
+        apply_stock_deltas(branch_id, stock_deltas)
+        rollup.apply()
+        db.session.commit()
+    except IntegrityError:
+        # Another request recorded some of these keys meanwhile; a resend resolves them
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Batch conflicted with a concurrent submission, please resend'}), 409
+
+    return jsonify({
+        'success': True,
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'duplicates': sum(1 for result in results if result['status'] == 'duplicate'),
+        'results': results
+    })
+
+@bp.route('/receipt/<transaction_id>')
+@login_required
+def receipt_pdf(transaction_id):
+    return receipt_response(transaction_id, 'pdf', 'application/pdf')
+
+@bp.route('/receipt/<transaction_id>/qr.png')
+@login_required
+def receipt_qr(transaction_id):
+    return receipt_response(transaction_id, 'png', 'image/png')
+
+@bp.route('/customers')
+@login_required
+def customers():
+    per_page = 20
+    search = request.args.get('search', '')
+
+    query = Customer.query.filter_by(is_active=True)
+
+    if search:
+        query = query.filter(
+            db.or_(
+                Customer.name.contains(search),
+                Customer.email.contains(search),
+                Customer.phone.contains(search)
+            )
+        )
+
+    customers = paginate_keyset(query, [Customer.id], per_page)
+
+    return render_template('customers.html', customers=customers, search=search)
+
+@bp.route('/api/customers/search')
+@login_required
+def search_customers():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify([])
+
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+
+    customers = Customer.query.filter(
+        Customer.is_active == True,
+        db.or_(
+            Customer.name.contains(query),
+            Customer.email.contains(query),
+            Customer.phone.contains(query)
+        )
+    ).order_by(Customer.name, Customer.id).limit(limit).with_entities(Customer.id, Customer.name, Customer.phone)
+
+    return jsonify([{'id': id, 'name': name, 'phone': phone} for id, name, phone in customers])
+
+@bp.route('/customer/add', methods=['GET', 'POST'])
+@login_required
+def add_customer():
+    form = CustomerForm()
+
+    if form.validate_on_submit():
+        # Parse birthday
+        birthday = None
+        if form.birthday.data:
+            try:
+                birthday = datetime.strptime(form.birthday.data, '%Y-%m-%d').date()
+            except ValueError:
+                flash('Invalid birthday format. Use YYYY-MM-DD', 'error')
+                return render_template('customer_form.html', form=form, title='Add Customer')
+
+        customer = Customer(
+            name=form.name.data,
+            email=form.email.data,
+            phone=form.phone.data,
+            address=form.address.data,
+            customer_type=form.customer_type.data,
+            birthday=birthday
+        )
+
+        db.session.add(customer)
+        db.session.commit()
+
+        flash('Customer added successfully', 'success')
+        return redirect(url_for('pos.customers'))
+
+    return render_template('customer_form.html', form=form, title='Add Customer')
+
+@bp.route('/support')
+@login_required
+def support():
+    tickets = SupportTicket.query.filter_by(user_id=current_user.id).all()
+    return render_template('support.html', tickets=tickets)
@@ -0,0 +1,192 @@
+"""
+Suppliers and purchase invoices.
+"""
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
+from datetime import datetime
+import uuid
+from extensions import db
+from models import Category, Supplier, PurchaseInvoice, PurchaseInvoiceItem, ProductMovement
+from helpers import run_write, paginate_keyset, apply_stock_deltas, ensure_inventory_rows
+
+bp = Blueprint('purchasing', __name__)
+
+@bp.route('/suppliers')
+@login_required
+def suppliers():
+    per_page = 20
+    search = request.args.get('search', '')
+
+    query = Supplier.query.filter_by(is_active=True)
+
+    if search:
+        query = query.filter(
+            db.or_(
+                Supplier.name.contains(search),
+                Supplier.email.contains(search),
+                Supplier.phone.contains(search)
+            )
+        )
+
+    suppliers = paginate_keyset(query, [Supplier.id], per_page)
+
+    return render_template('suppliers.html', suppliers=suppliers, search=search)
+
+@bp.route('/supplier/add', methods=['GET', 'POST'])
+@login_required
+def add_supplier():
+    if request.method == 'POST':
+        supplier = Supplier(
+            name=request.form.get('name'),
+            email=request.form.get('email'),
+            phone=request.form.get('phone'),
+            address=request.form.get('address')
+        )
+
+        db.session.add(supplier)
+        db.session.commit()
+
+        flash('Supplier added successfully', 'success')
+        return redirect(url_for('purchasing.suppliers'))
+
+    return render_template('supplier_form.html', title='Add Supplier')
+
+@bp.route('/supplier/edit/<int:id>', methods=['GET', 'POST'])
+@login_required
+def edit_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+
+    if request.method == 'POST':
+        supplier.name = request.form.get('name')
+        supplier.email = request.form.get('email')
+        supplier.phone = request.form.get('phone')
+        supplier.address = request.form.get('address')
+
+        db.session.commit()
+
+        flash('Supplier updated successfully', 'success')
+        return redirect(url_for('purchasing.suppliers'))
+
+    return render_template('supplier_form.html', title='Edit Supplier', supplier=supplier)
+
+@bp.route('/supplier/delete/<int:id>', methods=['POST'])
+@login_required
+def delete_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+    supplier.is_active = False
+    db.session.commit()
+
+    return jsonify({'success': True, 'message': 'Supplier deleted successfully'})
+
+@bp.route('/purchase_invoices')
+@login_required
+def purchase_invoices():
+    per_page = 20
+    search = request.args.get('search', '')
+    status_filter = request.args.get('status', '')
+
+    query = PurchaseInvoice.query
+
+    if search:
+        query = query.filter(
+            db.or_(
+                PurchaseInvoice.invoice_number.contains(search),
+                PurchaseInvoice.supplier.has(Supplier.name.contains(search))
+            )
+        )
+
+    if status_filter:
+        query = query.filter(PurchaseInvoice.status == status_filter)
+
+    invoices = paginate_keyset(query, [PurchaseInvoice.created_at, PurchaseInvoice.id], per_page, descending=True)
+
+    return render_template('purchase_invoices.html', invoices=invoices, search=search, status_filter=status_filter)
+
+@bp.route('/purchase_invoice/<int:id>')
+@login_required
+def purchase_invoice_detail(id):
+    invoice = PurchaseInvoice.query.get_or_404(id)
+    return render_template('purchase_invoice_detail.html', invoice=invoice)
+
+def record_purchase_invoice(invoice_number, data, user_id, branch_id):
+    """Add a received purchase invoice and its stock changes to the session; returns the invoice id.
+
+    The caller owns the commit.
+    """
+    invoice = PurchaseInvoice(
+        invoice_number=invoice_number,
+        supplier_id=data['supplier_id'],
+        user_id=user_id,
+        branch_id=branch_id,
+        invoice_date=datetime.strptime(data['invoice_date'], '%Y-%m-%d').date(),
+        total_amount=data['total_amount'],
+        tax_amount=data.get('tax_amount', 0),
+        discount_amount=data.get('discount_amount', 0),
+        notes=data.get('notes', ''),
+        status='completed'
+    )
+
+    db.session.add(invoice)
+    db.session.flush()
+
+    # Create invoice items and movements
+    received = {}
+    for item in data['items']:
+        invoice_item = PurchaseInvoiceItem(
+            purchase_invoice_id=invoice.id,
+            product_id=item['product_id'],
+            quantity=item['quantity'],
+            unit_cost=item['unit_cost'],
+            total=item['total']
+        )
+        db.session.add(invoice_item)
+
+        # Create product movement
+        movement = ProductMovement(
+            product_id=item['product_id'],
+            branch_id=branch_id,
+            movement_type='purchase',
+            quantity=item['quantity'],
+            user_id=user_id,
+            reason='Purchase Invoice',
+            notes=f'Invoice: {invoice_number}'
+        )
+        db.session.add(movement)
+        received[item['product_id']] = received.get(item['product_id'], 0) + item['quantity']
+
+    # Update inventory in one relative UPDATE so concurrent sales are kept,
+    # creating missing branch rows first so no movement is left unapplied;
+    # apply_stock_deltas subtracts, so pass the negated quantities
+    ensure_inventory_rows(branch_id, received)
+    apply_stock_deltas(branch_id, {product_id: -quantity for product_id, quantity in received.items()})
+    return invoice.id
+
+@bp.route('/purchase_invoice/add', methods=['GET', 'POST'])
+@login_required
+def add_purchase_invoice():
+    if request.method == 'POST':
+        data = request.get_json()
+
+        # Generate invoice number
+        invoice_number = f"PI{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+
+        invoice_id = run_write(
+            record_purchase_invoice,
+            invoice_number=invoice_number,
+            data=data,
+            user_id=current_user.id,
+            branch_id=current_user.branch_id or 1
+        )
+
+        return jsonify({
+            'success': True,
+            'invoice_id': invoice_id,
+            'invoice_number': invoice_number,
+            'message': 'Purchase invoice created successfully'
+        })
+
+    suppliers = Supplier.query.filter_by(is_active=True).all()
+    categories = Category.query.filter_by(is_active=True).all()
+    today_date = datetime.now().strftime('%Y-%m-%d')
+    return render_template('purchase_invoice_form.html', title='Add Purchase Invoice', suppliers=suppliers, categories=categories, today_date=today_date)
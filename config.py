@@ -0,0 +1,115 @@
+"""
+Application settings.
+
+Every setting is read from the environment (or a ``.env`` file) with a
+default that suits a single store running on SQLite.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+from storage import engine_options
+
+
+def configure(app, overrides=None):
+    """Load the settings into ``app.config``; ``overrides`` replace environment values"""
+    load_dotenv()
+
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///pos_system.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+
+    # Storage: pragmas for a SQLite file, connection pool for a database server
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_SIZE_KB'] = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))  # PostgreSQL only; 0 means no limit
+
+    # Sales configuration
+    app.config['REJECT_NEGATIVE_STOCK'] = os.getenv('REJECT_NEGATIVE_STOCK', 'False').lower() == 'true'
+    app.config['SALE_BATCH_MAX'] = int(os.getenv('SALE_BATCH_MAX', 500))
+    app.config['TRANSFER_MAX_LINES'] = int(os.getenv('TRANSFER_MAX_LINES', 5000))
+
+    # Group commit: one writer thread per worker commits queued sales, holds and
+    # purchase invoices together (meant for SQLite, where writers share one lock)
+    app.config['GROUP_COMMIT'] = os.getenv('GROUP_COMMIT', 'False').lower() == 'true'
+    app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.getenv('GROUP_COMMIT_MAX_BATCH', 64))
+    app.config['GROUP_COMMIT_WAIT_MS'] = float(os.getenv('GROUP_COMMIT_WAIT_MS', 2))
+    app.config['GROUP_COMMIT_MAX_PENDING'] = int(os.getenv('GROUP_COMMIT_MAX_PENDING', 1000))
+    app.config['GROUP_COMMIT_TIMEOUT'] = float(os.getenv('GROUP_COMMIT_TIMEOUT', 10))
+
+    # Search configuration
+    app.config['SEARCH_INDEX_REFRESH_SECONDS'] = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', 2))
+    app.config['SEARCH_MAX_RESULTS'] = int(os.getenv('SEARCH_MAX_RESULTS', 1000))
+
+    # Held transaction notifications
+    app.config['HELD_EVENTS_POLL_SECONDS'] = float(os.getenv('HELD_EVENTS_POLL_SECONDS', 1))
+    app.config['HELD_EVENTS_STREAM_SECONDS'] = int(os.getenv('HELD_EVENTS_STREAM_SECONDS', 300))
+
+    # Held transaction expiry sweep
+    app.config['HELD_SWEEP_INTERVAL_SECONDS'] = int(os.getenv('HELD_SWEEP_INTERVAL_SECONDS', 300))  # 0 disables the background sweeper
+    app.config['HELD_SWEEP_BATCH_SIZE'] = int(os.getenv('HELD_SWEEP_BATCH_SIZE', 500))
+    app.config['HELD_SWEEP_ARCHIVE'] = os.getenv('HELD_SWEEP_ARCHIVE', 'False').lower() == 'true'
+
+    # Product cache configuration
+    app.config['PRODUCT_CACHE_SIZE'] = int(os.getenv('PRODUCT_CACHE_SIZE', 10000))
+    app.config['PRODUCT_CACHE_CHECK_SECONDS'] = float(os.getenv('PRODUCT_CACHE_CHECK_SECONDS', 1))
+
+    # Pagination: list views page by cursor; totals are cached counts
+    app.config['COUNT_CACHE_SIZE'] = int(os.getenv('COUNT_CACHE_SIZE', 256))
+    app.config['COUNT_CACHE_SECONDS'] = float(os.getenv('COUNT_CACHE_SECONDS', 30))
+
+    # Reports configuration
+    app.config['REPORT_CACHE_SIZE'] = int(os.getenv('REPORT_CACHE_SIZE', 256))
+    app.config['REPORT_MAX_ROWS'] = int(os.getenv('REPORT_MAX_ROWS', 500))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 2000))
+    app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 1000))  # rows per bulk statement
+
+    # Receipt rendering
+    app.config['RECEIPT_CACHE_DIR'] = os.getenv('RECEIPT_CACHE_DIR', os.path.join(app.instance_path, 'receipts'))
+    app.config['RECEIPT_WORKERS'] = int(os.getenv('RECEIPT_WORKERS', 2))
+    app.config['RECEIPT_MAX_PENDING'] = int(os.getenv('RECEIPT_MAX_PENDING', 32))
+    app.config['RECEIPT_RENDER_TIMEOUT'] = float(os.getenv('RECEIPT_RENDER_TIMEOUT', 15))
+    app.config['RECEIPT_PRERENDER'] = os.getenv('RECEIPT_PRERENDER', 'True').lower() == 'true'
+
+    # Inventory ledger
+    app.config['LEDGER_CHECKPOINT_INTERVAL_SECONDS'] = int(os.getenv('LEDGER_CHECKPOINT_INTERVAL_SECONDS', 3600))  # 0 disables the background job
+
+    # Demand forecasting and reorder suggestions
+    app.config['FORECAST_METHOD'] = os.getenv('FORECAST_METHOD', 'ses')  # ses or sma
+    app.config['FORECAST_ALPHA'] = float(os.getenv('FORECAST_ALPHA', 0.3))
+    app.config['FORECAST_WINDOW_DAYS'] = int(os.getenv('FORECAST_WINDOW_DAYS', 28))
+    app.config['FORECAST_HISTORY_DAYS'] = int(os.getenv('FORECAST_HISTORY_DAYS', 180))
+    app.config['FORECAST_LEAD_DAYS'] = int(os.getenv('FORECAST_LEAD_DAYS', 7))
+    app.config['FORECAST_COVER_DAYS'] = int(os.getenv('FORECAST_COVER_DAYS', 14))
+
+    # Cold start budget for `flask check-startup`
+    app.config['STARTUP_BUDGET_MS'] = float(os.getenv('STARTUP_BUDGET_MS', 1000))
+
+    # Request profiling and the /metrics endpoint
+    app.config['PROFILING'] = os.getenv('PROFILING', 'True').lower() == 'true'
+    app.config['PROFILE_SLOW_QUERY_MS'] = float(os.getenv('PROFILE_SLOW_QUERY_MS', 200))
+    app.config['PROFILE_SLOW_REQUEST_MS'] = float(os.getenv('PROFILE_SLOW_REQUEST_MS', 1000))
+    app.config['PROFILE_STATEMENT_WARN'] = int(os.getenv('PROFILE_STATEMENT_WARN', 50))  # log requests running more statements
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # bearer token for scrapers; admins can always read /metrics
+
+    # Email configuration
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True').lower() == 'true'
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
+
+    app.config.update(overrides or {})
+    app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    )
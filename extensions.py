@@ -0,0 +1,14 @@
+"""
+Flask extensions, created unbound and attached to the app by ``create_app``.
+"""
+
+from flask_login import LoginManager
+from flask_mail import Mail
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+login_manager = LoginManager()
+login_manager.login_view = 'pos.login'
+
+mail = Mail()
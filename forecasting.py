@@ -0,0 +1,64 @@
+"""
+Vectorized demand forecasting and reorder quantities.
+
+Works on flat NumPy arrays so every product/branch pair is handled in one
+pass: daily sales arrive as sparse ``(pair, day, quantity)`` triples and are
+folded into per-pair demand with ``bincount`` instead of a dense
+pairs x days matrix, which keeps memory proportional to the sales rows.
+"""
+
+import numpy as np
+
+METHODS = ('sma', 'ses')
+
+
+def daily_demand(pair_index, day_index, quantity, n_pairs, n_days, method='ses', alpha=0.3, window=28):
+    """Expected units sold per day for each pair.
+
+    ``day_index`` counts from the start of the history, so ``n_days - 1`` is
+    the most recent day. ``sma`` is the mean over the last ``window`` days;
+    ``ses`` is simple exponential smoothing over the whole history started
+    from zero, expanded into a weighted sum so it needs no per-day loop.
+    """
+    pair_index = np.asarray(pair_index, dtype=np.int64)
+    age = (n_days - 1) - np.asarray(day_index, dtype=np.int64)
+    quantity = np.asarray(quantity, dtype=np.float64)
+
+    if method == 'sma':
+        window = min(window, n_days)
+        recent = age < window
+        return np.bincount(pair_index[recent], weights=quantity[recent], minlength=n_pairs) / window
+    if method == 'ses':
+        weights = alpha * np.power(1.0 - alpha, age)
+        return np.bincount(pair_index, weights=quantity * weights, minlength=n_pairs)
+    raise ValueError(f'Unknown forecast method: {method}')
+
+
+def reorder_quantities(on_hand, demand, min_stock, max_stock, box_qty, lead_days=7, cover_days=14):
+    """Suggested order quantities and days of cover per pair.
+
+    A pair is reordered when its stock would reach ``min_stock`` within the
+    lead time. It is then topped up to cover ``lead_days + cover_days`` of
+    demand above ``min_stock``, capped at ``max_stock`` (0 or negative means
+    no cap) and rounded to whole boxes.
+    """
+    on_hand = np.asarray(on_hand, dtype=np.float64)
+    demand = np.asarray(demand, dtype=np.float64)
+    min_stock = np.asarray(min_stock, dtype=np.float64)
+    max_stock = np.asarray(max_stock, dtype=np.float64)
+    box_qty = np.maximum(np.asarray(box_qty, dtype=np.float64), 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(demand > 0, np.maximum(on_hand, 0) / demand, np.inf)
+
+    reorder_point = min_stock + demand * lead_days
+    target = min_stock + demand * (lead_days + cover_days)
+    capped = max_stock > 0
+    target = np.where(capped, np.minimum(target, max_stock), target)
+
+    needed = np.where(on_hand <= reorder_point, np.maximum(target - on_hand, 0), 0)
+    boxes = np.ceil(needed / box_qty)
+    # Whole boxes may overshoot max_stock; drop boxes until they fit
+    room = np.where(capped, np.floor(np.maximum(max_stock - on_hand, 0) / box_qty), np.inf)
+    boxes = np.minimum(boxes, room)
+    return (boxes * box_qty).astype(np.int64), days_of_cover
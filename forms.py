@@ -0,0 +1,70 @@
+"""
+WTForms forms for the HTML views.
+"""
+
+from flask_wtf import FlaskForm
+from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, IntegerField, FloatField
+from wtforms.validators import DataRequired, Optional
+
+# Forms
+class LoginForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired()])
+    password = PasswordField('Password', validators=[DataRequired()])
+    submit = SubmitField('Login')
+
+class ProductForm(FlaskForm):
+    name = StringField('Product Name', validators=[DataRequired()])
+    description = TextAreaField('Description')
+    sku = StringField('SKU', validators=[DataRequired()])
+    category_id = SelectField('Category', coerce=int, validators=[Optional()])
+    price = FloatField('Price', validators=[DataRequired()])
+    cost_price = FloatField('Cost Price', validators=[Optional()])
+    min_stock = IntegerField('Minimum Stock', default=0, validators=[Optional()])
+    max_stock = IntegerField('Maximum Stock', validators=[Optional()])
+    # New fields
+    box_qty = IntegerField('Units per Box', default=1, validators=[Optional()])
+    is_favorite = SelectField('Favorite Product', choices=[('False', 'No'), ('True', 'Yes')], default='False')
+    expiry_date = StringField('Expiry Date (YYYY-MM-DD)', validators=[Optional()])
+    submit = SubmitField('Save Product')
+
+class CategoryForm(FlaskForm):
+    name = StringField('Category Name', validators=[DataRequired()])
+    description = TextAreaField('Description')
+    parent_id = SelectField('Parent Category', coerce=int, validators=[Optional()])
+    submit = SubmitField('Save Category')
+
+class CustomerForm(FlaskForm):
+    name = StringField('Customer Name', validators=[DataRequired()])
+    email = StringField('Email', validators=[Optional()])
+    phone = StringField('Phone')
+    address = TextAreaField('Address')
+    customer_type = SelectField('Customer Type', choices=[
+        ('regular', 'Regular'),
+        ('vip', 'VIP'),
+        ('wholesale', 'Wholesale')
+    ], default='regular')
+    birthday = StringField('Birthday (YYYY-MM-DD)')
+    submit = SubmitField('Save Customer')
+
+class UserForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired()])
+    email = StringField('Email', validators=[DataRequired()])
+    password = PasswordField('Password', validators=[Optional()])
+    role = SelectField('Role', choices=[
+        ('admin', 'Admin'),
+        ('manager', 'Manager'),
+        ('cashier', 'Cashier'),
+        ('inventory_manager', 'Inventory Manager')
+    ], default='cashier')
+    branch_id = SelectField('Branch', coerce=int, validators=[Optional()])
+    submit = SubmitField('Save User')
+
+class BranchForm(FlaskForm):
+    name = StringField('Branch Name', validators=[DataRequired()])
+    address = TextAreaField('Address')
+    phone = StringField('Phone')
+    submit = SubmitField('Save Branch')
+
+class HeldTransactionForm(FlaskForm):
+    notes = TextAreaField('Notes')
+    submit = SubmitField('Hold Transaction')
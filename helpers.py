@@ -0,0 +1,1986 @@
+"""
+Application logic shared by the blueprints and the CLI commands.
+
+Caches, counters, stock and sales bookkeeping, reports, imports, exports and
+receipts. Everything here runs inside an application context and reads its
+settings from ``current_app.config``.
+"""
+
+from flask import current_app, request, jsonify, Response
+from flask_login import current_user
+from datetime import datetime, timedelta
+import csv
+import io
+import json
+import tempfile
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from search_index import ProductSearchIndex
+from product_cache import ProductCache
+from pagination import CountCache, InvalidCursor, keyset_paginate, paginate_ids
+from migrations import migrate
+from storage import install_sqlite_pragmas, sqlite_pragmas, storage_report
+from receipts import ReceiptRenderer, ReceiptQueueFull
+from write_queue import GroupCommitWriter
+from profiling import RequestProfiler
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from extensions import db
+from models import (
+    Branch, Category, Product, ProductBarcode, Inventory, Customer, Transaction, SaleSubmission, TransactionItem,
+    SalesRollup, ProductSalesRollup, HeldTransaction, HeldTransactionArchive, ProductMovement, HeldTransactionCount,
+    MaintenanceRun, LowStockItem, StockCheckpoint, ReorderSuggestion, VersionCounter, normalize_barcodes
+)
+
+# Application setup
+def init_app(app):
+    """Apply the database settings, build the caches and worker pools and install the profiler configured for ``app``"""
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, sqlite_pragmas(app.config))
+    product_cache.maxsize = app.config['PRODUCT_CACHE_SIZE']
+    count_cache.maxsize = app.config['COUNT_CACHE_SIZE']
+    count_cache.ttl = app.config['COUNT_CACHE_SECONDS']
+    app.extensions['receipt_renderer'] = ReceiptRenderer(
+        app.config['RECEIPT_CACHE_DIR'],
+        max_workers=app.config['RECEIPT_WORKERS'],
+        max_pending=app.config['RECEIPT_MAX_PENDING']
+    )
+    app.extensions['group_commit_writer'] = GroupCommitWriter(
+        db.session,
+        context=app.app_context,
+        max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+        max_wait=app.config['GROUP_COMMIT_WAIT_MS'] / 1000,
+        max_pending=app.config['GROUP_COMMIT_MAX_PENDING']
+    )
+    if app.config['PROFILING']:
+        with app.app_context():
+            app.extensions['request_profiler'] = RequestProfiler(
+                app, db.engine,
+                slow_query_ms=app.config['PROFILE_SLOW_QUERY_MS'],
+                slow_request_ms=app.config['PROFILE_SLOW_REQUEST_MS'],
+                statement_warn=app.config['PROFILE_STATEMENT_WARN']
+            )
+
+# Context processors
+def inject_held_transactions_count():
+    """Make held transactions count available in all templates"""
+    if current_user.is_authenticated:
+        return {'held_transactions_count': held_count(current_user.id)}
+    return {'held_transactions_count': 0}
+
+# Held transaction helpers
+def held_count(user_id):
+    """Read a user's held transaction count without writing anything.
+
+    The counter row is created by ``adjust_held_count`` with the user's first
+    hold; until then the holds are counted directly.
+    """
+    count = db.session.query(HeldTransactionCount.count).filter_by(user_id=user_id).scalar()
+    if count is None:
+        # Expired holds count until the sweeper removes them
+        count = HeldTransaction.query.filter_by(user_id=user_id).count()
+    return count
+
+def adjust_held_count(user_id, delta):
+    """Apply a change to a user's held count in the current transaction"""
+    version = bump_version('held')
+    updated = HeldTransactionCount.query.filter_by(user_id=user_id).update({
+        HeldTransactionCount.count: HeldTransactionCount.count + delta,
+        HeldTransactionCount.version: version
+    }, synchronize_session=False)
+    if not updated:
+        # First change for this user: count the rows, including this one
+        count = HeldTransaction.query.filter_by(user_id=user_id).count()
+        db.session.add(HeldTransactionCount(user_id=user_id, count=count, version=version))
+
+class HeldCountBroker:
+    """Fan out held count changes to the event streams open in this process.
+
+    Changes made by this worker are published right after commit. Changes
+    from other workers are picked up by one watcher thread that reads the
+    'held' version counter, so the database sees one cheap query per worker
+    per poll interval no matter how many browsers are connected.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of queues
+        self._watcher = None
+        self._version = None
+
+    def subscribe(self, user_id):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+            if self._watcher is None:
+                # Baseline taken now so changes made before the first poll are not missed
+                self._version = current_version('held')
+                self._watcher = threading.Thread(
+                    target=self._watch, args=(current_app._get_current_object(),), name='held-count-watcher', daemon=True
+                )
+                self._watcher.start()
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, count):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            subscriber.put(count)
+
+    def _watch(self, app):
+        while True:
+            time.sleep(app.config['HELD_EVENTS_POLL_SECONDS'])
+            with self._lock:
+                user_ids = list(self._subscribers)
+            if not user_ids:
+                continue
+            try:
+                with app.app_context():
+                    version = current_version('held')
+                    if version > self._version:
+                        changed = db.session.query(HeldTransactionCount.user_id, HeldTransactionCount.count).filter(
+                            HeldTransactionCount.version > self._version,
+                            HeldTransactionCount.user_id.in_(user_ids)
+                        ).all()
+                        for user_id, count in changed:
+                            self.publish(user_id, count)
+                    self._version = version
+            except Exception:
+                app.logger.exception('Held count watcher failed')
+
+held_count_broker = HeldCountBroker()
+
+def sweep_expired_holds(batch_size=None, pause=0.05):
+    """Remove (or archive) expired held transactions in short batches.
+
+    Each batch is its own small transaction so cashiers are never locked out
+    for long. Batches start by bumping the 'held_sweep' counter, which also
+    serialises sweepers running in several workers. Returns rows removed.
+    """
+    batch_size = batch_size or current_app.config['HELD_SWEEP_BATCH_SIZE']
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    removed = 0
+    error = None
+
+    try:
+        while True:
+            bump_version('held_sweep')
+            expired = db.session.query(HeldTransaction.id, HeldTransaction.user_id).filter(
+                HeldTransaction.expires_at <= datetime.utcnow()
+            ).order_by(HeldTransaction.expires_at).limit(batch_size).all()
+            if not expired:
+                db.session.rollback()
+                break
+
+            ids_by_user = {}
+            for hold_id, user_id in expired:
+                ids_by_user.setdefault(user_id, []).append(hold_id)
+
+            if current_app.config['HELD_SWEEP_ARCHIVE']:
+                columns = ['id', 'transaction_id', 'user_id', 'branch_id', 'cart_data',
+                           'customer_data', 'notes', 'created_at', 'expires_at']
+                source = db.select(*[getattr(HeldTransaction, c) for c in columns]).where(
+                    HeldTransaction.id.in_([hold_id for hold_id, _ in expired])
+                )
+                db.session.execute(db.insert(HeldTransactionArchive).from_select(columns, source))
+
+            for user_id, hold_ids in ids_by_user.items():
+                deleted = HeldTransaction.query.filter(
+                    HeldTransaction.id.in_(hold_ids)
+                ).delete(synchronize_session=False)
+                if deleted:
+                    adjust_held_count(user_id, -deleted)
+                    removed += deleted
+            db.session.commit()
+
+            for user_id in ids_by_user:
+                held_count_broker.publish(user_id, held_count(user_id))
+
+            if len(expired) < batch_size:
+                break
+            # Let waiting writers in between batches
+            time.sleep(pause)
+    except Exception as e:
+        db.session.rollback()
+        error = str(e)
+        current_app.logger.exception('Held transaction sweep failed')
+
+    record_maintenance_run('held_sweep', started_at, started, removed, error)
+    db.session.commit()
+    return removed
+
+def held_maintenance_stats():
+    """Held table size and the outcome of the last expiry sweep"""
+    run = db.session.get(MaintenanceRun, 'held_sweep')
+    return {
+        'held_rows': HeldTransaction.query.count(),
+        'expired_rows': HeldTransaction.query.filter(HeldTransaction.expires_at <= datetime.utcnow()).count(),
+        'archived_rows': HeldTransactionArchive.query.count(),
+        'last_sweep_at': run.started_at.isoformat() if run and run.started_at else None,
+        'last_sweep_duration_ms': round(run.duration_ms, 1) if run and run.duration_ms is not None else None,
+        'last_sweep_rows': run.rows if run else None,
+        'last_sweep_error': run.error if run else None
+    }
+
+_background_jobs = {'started': False}
+
+def held_sweeper_loop(app):
+    while True:
+        time.sleep(app.config['HELD_SWEEP_INTERVAL_SECONDS'])
+        try:
+            with app.app_context():
+                sweep_expired_holds()
+        except Exception:
+            app.logger.exception('Held transaction sweeper failed')
+
+def start_background_jobs():
+    """Run the storage self-check and start the periodic jobs with the first request this worker serves"""
+    if _background_jobs['started'] or current_app.config['TESTING']:
+        return
+    _background_jobs['started'] = True
+    log_storage_report()
+    app = current_app._get_current_object()
+    if app.config['HELD_SWEEP_INTERVAL_SECONDS'] > 0:
+        threading.Thread(target=held_sweeper_loop, args=(app,), name='held-sweeper', daemon=True).start()
+    if app.config['LEDGER_CHECKPOINT_INTERVAL_SECONDS'] > 0:
+        threading.Thread(target=ledger_loop, args=(app,), name='ledger-checkpoint', daemon=True).start()
+
+# Inventory ledger helpers
+def record_maintenance_run(name, started_at, started, rows, error=None):
+    run = db.session.get(MaintenanceRun, name) or MaintenanceRun(name=name)
+    run.started_at = started_at
+    run.duration_ms = (time.perf_counter() - started) * 1000
+    run.rows = rows
+    run.error = error
+    db.session.add(run)
+
+def checkpoint_stock():
+    """Fold movements recorded since the last checkpoint into the stock checkpoints.
+
+    Only movements up to the highest id seen by the previous run are folded:
+    ids are assigned before commit, so a newer id can become visible before
+    an older one, but not an entire run interval later. Work is proportional
+    to the movements since the last checkpoint. Returns pairs updated.
+    """
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+
+    bump_version('ledger_run')  # serialises runs in several workers
+    checkpointed = current_version('ledger_checkpoint')
+    horizon = current_version('ledger_horizon')
+    latest = db.session.query(db.func.max(ProductMovement.id)).scalar() or 0
+    if not horizon:
+        horizon = latest  # first run: there is no earlier observation to wait for
+
+    deltas = []
+    if horizon > checkpointed:
+        deltas = [
+            {'product_id': product_id, 'branch_id': branch_id, 'quantity': quantity}
+            for product_id, branch_id, quantity in db.session.query(
+                ProductMovement.product_id, ProductMovement.branch_id, db.func.sum(ProductMovement.quantity)
+            ).filter(
+                ProductMovement.id > checkpointed, ProductMovement.id <= horizon
+            ).group_by(ProductMovement.product_id, ProductMovement.branch_id)
+        ]
+        upsert_increment(StockCheckpoint, ['product_id', 'branch_id'], deltas)
+        set_counter('ledger_checkpoint', horizon)
+    set_counter('ledger_horizon', latest)
+
+    record_maintenance_run('ledger_checkpoint', started_at, started, len(deltas))
+    db.session.commit()
+    return len(deltas)
+
+def reconcile_stock(full=False):
+    """Compare Inventory.quantity with checkpoint plus movements since the checkpoint.
+
+    By default only pairs with movements since the checkpoint, or whose
+    inventory row changed since it was taken, are checked. ``full`` checks
+    every pair. Returns the drifted pairs, largest drift first.
+    """
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    checkpointed = current_version('ledger_checkpoint')
+    last_run = db.session.get(MaintenanceRun, 'ledger_checkpoint')
+    full = full or last_run is None
+
+    recent = db.session.query(
+        ProductMovement.product_id.label('product_id'),
+        ProductMovement.branch_id.label('branch_id'),
+        db.func.sum(ProductMovement.quantity).label('delta')
+    ).filter(ProductMovement.id > checkpointed).group_by(
+        ProductMovement.product_id, ProductMovement.branch_id
+    ).subquery()
+
+    def expected_stock(pairs):
+        return db.func.coalesce(StockCheckpoint.quantity, 0) + db.func.coalesce(recent.c.delta, 0), pairs.outerjoin(
+            StockCheckpoint, db.and_(StockCheckpoint.product_id == pairs.c.product_id,
+                                     StockCheckpoint.branch_id == pairs.c.branch_id)
+        ).outerjoin(
+            recent, db.and_(recent.c.product_id == pairs.c.product_id, recent.c.branch_id == pairs.c.branch_id)
+        )
+
+    # Inventory rows; one statement, so stock and movements come from the same snapshot
+    inventory = db.select(Inventory.product_id, Inventory.branch_id, Inventory.quantity, Inventory.last_updated).subquery()
+    expected, joined = expected_stock(inventory)
+    actual = db.func.coalesce(inventory.c.quantity, 0)
+    query = db.select(inventory.c.product_id, inventory.c.branch_id, actual, expected).select_from(joined).where(
+        actual != expected
+    )
+    if not full:
+        query = query.where(db.or_(recent.c.delta.isnot(None), inventory.c.last_updated >= last_run.started_at))
+    rows = db.session.execute(query).all()
+
+    # Ledger stock for pairs that have no inventory row at all
+    ledger_pairs = db.select(recent.c.product_id, recent.c.branch_id)
+    if full:
+        ledger_pairs = db.union(ledger_pairs, db.select(StockCheckpoint.product_id, StockCheckpoint.branch_id))
+    ledger_pairs = ledger_pairs.subquery()
+    expected, joined = expected_stock(ledger_pairs)
+    rows += db.session.execute(
+        db.select(ledger_pairs.c.product_id, ledger_pairs.c.branch_id, db.null(), expected).select_from(
+            joined.outerjoin(Inventory, db.and_(Inventory.product_id == ledger_pairs.c.product_id,
+                                                Inventory.branch_id == ledger_pairs.c.branch_id))
+        ).where(Inventory.id.is_(None), expected != 0)
+    ).all()
+
+    drift = [{
+        'product_id': product_id,
+        'branch_id': branch_id,
+        'inventory_quantity': quantity,
+        'ledger_quantity': ledger,
+        'drift': (quantity or 0) - ledger
+    } for product_id, branch_id, quantity, ledger in rows]
+    drift.sort(key=lambda row: (-abs(row['drift']), row['product_id'], row['branch_id']))
+
+    record_maintenance_run('ledger_reconcile', started_at, started, len(drift))
+    db.session.commit()
+    return drift
+
+def ledger_loop(app):
+    while True:
+        time.sleep(app.config['LEDGER_CHECKPOINT_INTERVAL_SECONDS'])
+        try:
+            with app.app_context():
+                checkpoint_stock()
+        except Exception:
+            app.logger.exception('Stock checkpoint failed')
+
+# Storage helpers
+def log_storage_report():
+    """Log the effective database settings, with a warning for each problem found"""
+    report = storage_report(db.engine, current_app.config)
+    current_app.logger.info('Storage: %s', ', '.join(f'{key}={value}' for key, value in report['settings'].items()))
+    for warning in report['warnings']:
+        current_app.logger.warning('Storage: %s', warning)
+    return report
+
+# Write helpers
+def run_write(func, *args, **kwargs):
+    """Run a write job and commit it, returning the job's result.
+
+    ``func`` adds its changes to the session without committing and must not
+    use ``current_user`` or the request, since with GROUP_COMMIT it runs on
+    the writer thread together with other requests' jobs. Its exceptions are
+    raised here either way; the result is returned only once committed.
+    """
+    if current_app.config['GROUP_COMMIT']:
+        return current_app.extensions['group_commit_writer'].run(func, *args, timeout=current_app.config['GROUP_COMMIT_TIMEOUT'], **kwargs)
+    try:
+        result = func(*args, **kwargs)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+def write_queue_full(error):
+    return jsonify({'success': False, 'message': 'Server is busy, please retry'}), 503
+
+def write_timeout(error):
+    return jsonify({
+        'success': False,
+        'message': 'The change is still being saved; resend it with the same idempotency key to check'
+    }), 503
+
+# Schema helpers
+def migrate_database(log=None):
+    """Bring the database schema up to date; returns the migration versions applied"""
+    return migrate(db.engine, db.metadata, log)
+
+# Hot request paths; their queries must be served by indexes. Placeholders
+# are filled from existing rows and paths whose rows are missing are skipped.
+PLAN_CHECK_URLS = [
+    '/', '/pos', '/api/held_transactions_count',
+    '/inventory', '/inventory?branch={branch_id}', '/products', '/product/{product_id}/movements',
+    '/suppliers', '/customers', '/purchase_invoices', '/purchase_invoices?status=completed',
+    '/purchase_invoice/{invoice_id}', '/reorder_suggestions',
+    '/api/products/search?q={product_name}', '/api/products/by_barcode/{barcode}',
+    '/api/products/list', '/api/products/list?category={category_id}',
+    '/api/catalog/changes?since={catalog_version}', '/reports?report=sales', '/api/reports/products',
+]
+PLAN_CHECK_TABLES = {
+    'product', 'product_barcode', 'inventory', 'transaction', 'transaction_item', 'product_movement',
+    'held_transaction', 'purchase_invoice', 'purchase_invoice_item'
+}
+
+# Catalog helpers
+def current_version(name):
+    """Read a named change counter"""
+    return db.session.query(VersionCounter.value).filter_by(name=name).scalar() or 0
+
+def bump_version(name):
+    """Increment a named change counter in the current transaction and return the new value.
+
+    The UPDATE locks the counter row until commit, so concurrent writers get
+    increasing values in commit order and readers never miss a change.
+    """
+    with db.session.no_autoflush:
+        updated = VersionCounter.query.filter_by(name=name).update(
+            {VersionCounter.value: VersionCounter.value + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.session.execute(db.insert(VersionCounter).values(name=name, value=1))
+            return 1
+        return db.session.query(VersionCounter.value).filter_by(name=name).scalar()
+
+def set_counter(name, value):
+    """Store a value in a named counter row, locking it until commit"""
+    with db.session.no_autoflush:
+        updated = VersionCounter.query.filter_by(name=name).update(
+            {VersionCounter.value: value}, synchronize_session=False
+        )
+        if not updated:
+            db.session.execute(db.insert(VersionCounter).values(name=name, value=value))
+
+@db.event.listens_for(db.session, 'before_flush')
+def stamp_catalog_changes(session, flush_context, instances):
+    """Give every added or modified product a new catalog version"""
+    changed = [obj for obj in session.new if isinstance(obj, Product)]
+    changed += [obj for obj in session.dirty if isinstance(obj, Product) and session.is_modified(obj)]
+    if changed:
+        version = bump_version('catalog')
+        for product in changed:
+            product.catalog_version = version
+
+@db.event.listens_for(db.session, 'before_flush')
+def stamp_customer_changes(session, flush_context, instances):
+    """Bump the 'customers' version when a customer is added, edited or deleted"""
+    changed = [obj for obj in list(session.new) + list(session.deleted) if isinstance(obj, Customer)]
+    changed += [obj for obj in session.dirty if isinstance(obj, Customer) and session.is_modified(obj)]
+    if changed:
+        bump_version('customers')
+
+def barcode_conflicts(barcodes, product_id=None):
+    """Return the barcodes already assigned to a product other than ``product_id``"""
+    if not barcodes:
+        return []
+    query = db.session.query(ProductBarcode.barcode).filter(ProductBarcode.barcode.in_(barcodes))
+    if product_id is not None:
+        query = query.filter(ProductBarcode.product_id != product_id)
+    return [row.barcode for row in query]
+
+def barcodes_by_product(products):
+    """Map product id to its barcodes.
+
+    ``products`` is a list of ids, read in IN batches of 500 so each query
+    stays within SQLite's bound parameter limit, or a Product query (a whole
+    catalog or its changes) whose barcodes are read in one statement.
+    """
+    query = db.session.query(ProductBarcode.product_id, ProductBarcode.barcode).order_by(
+        ProductBarcode.product_id, ProductBarcode.id
+    )
+    if isinstance(products, db.Query):
+        batches = [query.filter(ProductBarcode.product_id.in_(
+            products.with_entities(Product.id).order_by(None).scalar_subquery()
+        ))]
+    else:
+        batches = (query.filter(ProductBarcode.product_id.in_(batch)) for batch in chunked(products, 500))
+    barcodes = {}
+    for batch in batches:
+        for product_id, barcode in batch:
+            barcodes.setdefault(product_id, []).append(barcode)
+    return barcodes
+
+def backfill_product_barcodes():
+    """Create barcode rows for products whose JSON barcodes were never indexed"""
+    products = Product.query.filter(
+        Product.barcodes.isnot(None),
+        ~Product.barcode_entries.any()
+    ).all()
+    for product in products:
+        barcodes = [b for b in normalize_barcodes(product.barcode_list) if not barcode_conflicts([b], product.id)]
+        product.barcode_list = barcodes
+    db.session.commit()
+    return len(products)
+
+# Catalog sync: terminals keep the catalog locally and fetch changes by version
+CATALOG_FIELDS = ['id', 'name', 'sku', 'price', 'category_id', 'image', 'box_qty', 'is_favorite', 'barcodes']
+
+def catalog_rows(query):
+    """Compact catalog rows, in CATALOG_FIELDS order, for the products selected by ``query``"""
+    rows = query.with_entities(
+        Product.id, Product.name, Product.sku, Product.price, Product.category_id,
+        Product.image, Product.box_qty, Product.is_favorite
+    ).order_by(Product.id).all()
+    barcodes = barcodes_by_product(query)
+    return [list(row) + [barcodes.get(row[0], [])] for row in rows]
+
+def catalog_categories():
+    return [list(row) for row in Category.query.filter_by(is_active=True).with_entities(Category.id, Category.name)]
+
+# Product cache helpers
+product_cache = ProductCache()  # sized by init_app
+_product_cache_state = {'checked_at': 0.0}
+
+def product_record(product):
+    """Plain dict of the product fields served from the cache"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'sku': product.sku,
+        'price': product.price,
+        'cost_price': product.cost_price,
+        'box_qty': product.box_qty,
+        'image': product.image,
+        'category_id': product.category_id,
+        'category_name': product.category.name if product.category else None,
+        'is_active': product.is_active,
+        'track_inventory': product.track_inventory,
+        'min_stock': product.min_stock,
+        'max_stock': product.max_stock
+    }
+
+def sync_product_cache():
+    """Evict cached products changed since the cache's catalog version"""
+    now = time.monotonic()
+    if product_cache.version is not None and \
+            now - _product_cache_state['checked_at'] < current_app.config['PRODUCT_CACHE_CHECK_SECONDS']:
+        return product_cache.version
+    _product_cache_state['checked_at'] = now
+
+    version = current_version('catalog')
+    if product_cache.version is None or version < product_cache.version:
+        product_cache.sync(version)
+    elif version > product_cache.version:
+        changed = [row.id for row in db.session.query(Product.id).filter(
+            Product.catalog_version > product_cache.version
+        ).limit(product_cache.maxsize + 1)]
+        product_cache.sync(version, changed if len(changed) <= product_cache.maxsize else None)
+    return version
+
+def get_product_records(product_ids):
+    """Map id to cached product record, loading misses in one query"""
+    version = sync_product_cache()
+    records, missing = product_cache.get_many(product_ids)
+    if missing:
+        products = Product.query.options(db.joinedload(Product.category)).filter(Product.id.in_(missing))
+        for product in products:
+            record = product_record(product)
+            product_cache.put(record, version)
+            records[product.id] = record
+    return records
+
+def get_product_record_by_sku(sku):
+    """Cached product record for an exact SKU, or None"""
+    version = sync_product_cache()
+    record = product_cache.get_by_sku(sku)
+    if record is None:
+        product = Product.query.options(db.joinedload(Product.category)).filter_by(sku=sku).first()
+        if product:
+            record = product_record(product)
+            product_cache.put(record, version)
+    return record
+
+# Search helpers
+product_search_index = ProductSearchIndex()
+search_index_state = {'version': None, 'checked_at': 0.0}
+
+def product_search_documents(query):
+    """Build index documents for the products selected by ``query``"""
+    rows = query.outerjoin(Category, Product.category_id == Category.id).with_entities(
+        Product.id, Product.name, Product.sku, Product.is_active, Category.name
+    ).all()
+
+    barcodes = barcodes_by_product(query)
+
+    return [
+        (product_id, name, sku, is_active, barcodes.get(product_id, []), category_name)
+        for product_id, name, sku, is_active, category_name in rows
+    ]
+
+def refresh_product_search_index(force=False):
+    """Bring the search index up to date with catalog changes from any worker"""
+    state = search_index_state
+    now = time.monotonic()
+    if not force and state['version'] is not None and \
+            now - state['checked_at'] < current_app.config['SEARCH_INDEX_REFRESH_SECONDS']:
+        return
+    state['checked_at'] = now
+
+    version = current_version('catalog')
+    if force or state['version'] is None or version < state['version']:
+        documents = product_search_documents(Product.query.filter_by(is_active=True))
+        product_search_index.load(
+            (product_id, name, sku, codes, category_name)
+            for product_id, name, sku, _, codes, category_name in documents
+        )
+    elif version > state['version']:
+        documents = product_search_documents(Product.query.filter(Product.catalog_version > state['version']))
+        for product_id, name, sku, is_active, codes, category_name in documents:
+            if is_active:
+                product_search_index.add(product_id, name, sku, codes, category_name)
+            else:
+                product_search_index.remove(product_id)
+    state['version'] = version
+
+def search_product_ids(search, limit=None):
+    """Active product ids matching ``search``, best match first"""
+    refresh_product_search_index()
+    return product_search_index.search(search, limit=limit or current_app.config['SEARCH_MAX_RESULTS'])
+
+def ranked_product_ids(search, category_id=None):
+    """Every active product id matching ``search``, best match first, for paging a list view"""
+    refresh_product_search_index()
+    ids = product_search_index.search(search, limit=None)
+    if category_id:
+        in_category = {product_id for product_id, in db.session.query(Product.id).filter(Product.category_id == category_id)}
+        ids = [product_id for product_id in ids if product_id in in_category]
+    return ids
+
+def touch_category_products(category_id):
+    """Mark a category's products as changed so search and sync pick up the new name"""
+    Product.query.filter_by(category_id=category_id).update({
+        Product.updated_at: datetime.utcnow(),
+        Product.catalog_version: bump_version('catalog')
+    }, synchronize_session=False)
+
+# Pagination helpers
+count_cache = CountCache()  # sized by init_app
+
+def paginate_keyset(query, keys, per_page, descending=False, key_func=None, cursor_arg='cursor', count=True):
+    """Keyset page of ``query`` at the cursor in the request args; a bad cursor restarts at the first page"""
+    total = count_cache.count(query) if count else None
+    cursor = request.args.get(cursor_arg)
+    try:
+        return keyset_paginate(query, keys, cursor, per_page, descending, key_func, total)
+    except InvalidCursor:
+        return keyset_paginate(query, keys, None, per_page, descending, key_func, total)
+
+def paginate_ranked(query, id_column, ids, per_page, cursor_arg='cursor'):
+    """Page of ``query`` rows in the order of ``ids`` at the cursor in the request args; a bad cursor restarts"""
+    load = lambda page_ids: query.filter(id_column.in_(page_ids)).all()
+    try:
+        return paginate_ids(ids, load, request.args.get(cursor_arg), per_page)
+    except InvalidCursor:
+        return paginate_ids(ids, load, None, per_page)
+
+# Product list helpers
+def product_list_query():
+    """Active products with category and total stock, as plain rows from one SELECT"""
+    stock = db.session.query(
+        Inventory.product_id, db.func.sum(Inventory.quantity).label('total_stock')
+    ).group_by(Inventory.product_id).subquery()
+    return db.session.query(
+        Product.id, Product.name, Product.sku, Product.price, Product.cost_price, Product.image,
+        Product.min_stock, Product.box_qty, Category.id.label('category_id'), Category.name.label('category_name'),
+        db.func.coalesce(stock.c.total_stock, 0).label('total_stock')
+    ).outerjoin(Category, Category.id == Product.category_id).outerjoin(
+        stock, stock.c.product_id == Product.id
+    ).filter(Product.is_active == True)
+
+def product_list_page(cursor=None, per_page=50, search='', category_id=None):
+    """One page of the product picker: a cached count and a projection query, however deep the page.
+
+    A search pages through every match in rank order, so the total is the
+    real number of matches. Raises InvalidCursor for a malformed cursor.
+    """
+    query = product_list_query()
+    if search:
+        page = paginate_ids(
+            ranked_product_ids(search, category_id),
+            lambda page_ids: query.filter(Product.id.in_(page_ids)).all(),
+            cursor, per_page
+        )
+    else:
+        count = db.session.query(Product.id).filter(Product.is_active == True)
+        if category_id:
+            count = count.filter(Product.category_id == category_id)
+            query = query.filter(Product.category_id == category_id)
+        page = keyset_paginate(query, [Product.name, Product.id], cursor, per_page, total=count_cache.count(count))
+
+    return {
+        'products': [{
+            'id': row.id,
+            'name': row.name,
+            'sku': row.sku,
+            'price': row.price,
+            'cost_price': row.cost_price,
+            'image': row.image,
+            'category': {'id': row.category_id, 'name': row.category_name} if row.category_id else None,
+            'total_stock': row.total_stock,
+            'min_stock': row.min_stock,
+            'box_qty': row.box_qty
+        } for row in page.items],
+        'total': page.total,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
+
+def product_list_query_counts(pages=3, per_page=50):
+    """Statements run by each of the first ``pages`` product list pages, each with a cold count cache"""
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db.event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try:
+        counts = []
+        cursor = None
+        for _ in range(pages):
+            count_cache.clear()
+            del statements[:]
+            cursor = product_list_page(cursor, per_page=per_page)['next_cursor']
+            counts.append(len(statements))
+            if cursor is None:
+                break
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', count_statement)
+    return counts
+
+# Sales helpers
+class InsufficientStockError(Exception):
+    """Raised when a sale would take tracked stock below zero"""
+
+    def __init__(self, branch_id, requested):
+        super().__init__('Insufficient stock')
+        self.branch_id = branch_id
+        self.requested = requested
+
+def stock_shortages(branch_id, requested):
+    """List products in ``requested`` whose branch stock cannot cover the quantity"""
+    on_hand = dict(db.session.query(Inventory.product_id, Inventory.quantity).filter(
+        Inventory.branch_id == branch_id,
+        Inventory.product_id.in_(sorted(requested))
+    ).all())
+    return [
+        {'product_id': pid, 'requested': qty, 'available': on_hand.get(pid, 0)}
+        for pid, qty in sorted(requested.items())
+        if on_hand.get(pid, 0) < qty
+    ]
+
+def apply_stock_deltas(branch_id, deltas, reject_negative=False):
+    """Subtract quantities from branch inventory with set-based UPDATEs.
+
+    ``deltas`` maps product_id to the quantity leaving stock. Every row is
+    changed by a single ``quantity = quantity - CASE ...`` statement, so
+    concurrent sales never overwrite each other. With ``reject_negative`` the
+    UPDATE only applies where enough stock is left, and InsufficientStockError
+    is raised when a tracked product falls short. The caller must then roll
+    back the session before doing anything else.
+    """
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+
+    def decrement(product_ids, guarded):
+        delta_case = db.case(
+            {pid: deltas[pid] for pid in product_ids},
+            value=Inventory.product_id,
+            else_=0
+        )
+        query = Inventory.query.filter(
+            Inventory.branch_id == branch_id,
+            Inventory.product_id.in_(product_ids)
+        )
+        if guarded:
+            query = query.filter(Inventory.quantity >= delta_case)
+        return query.update({
+            Inventory.quantity: Inventory.quantity - delta_case,
+            Inventory.last_updated: now
+        }, synchronize_session=False)
+
+    if not reject_negative:
+        decrement(list(deltas), guarded=False)
+        refresh_low_stock(deltas, branch_id)
+        return
+
+    tracked_ids = {pid for pid, record in get_product_records(list(deltas)).items() if record['track_inventory']}
+    untracked_ids = [pid for pid in deltas if pid not in tracked_ids]
+
+    if tracked_ids and decrement(sorted(tracked_ids), guarded=True) != len(tracked_ids):
+        raise InsufficientStockError(branch_id, {pid: deltas[pid] for pid in tracked_ids})
+
+    if untracked_ids:
+        decrement(untracked_ids, guarded=False)
+
+    refresh_low_stock(tracked_ids, branch_id)
+
+def refresh_low_stock(product_ids, branch_id=None):
+    """Recompute low-stock membership for ``product_ids``, in one branch or all of them.
+
+    Call this in the same transaction as any change to inventory quantities
+    or to a product's minimum stock, tracking or active flag.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    db.session.flush()
+
+    delete = db.delete(LowStockItem).where(LowStockItem.product_id.in_(product_ids))
+    low = db.select(Inventory.product_id, Inventory.branch_id).join(
+        Product, Product.id == Inventory.product_id
+    ).where(
+        Inventory.product_id.in_(product_ids),
+        Product.is_active == True,
+        Product.track_inventory == True,
+        Inventory.quantity <= Product.min_stock
+    )
+    if branch_id is not None:
+        delete = delete.where(LowStockItem.branch_id == branch_id)
+        low = low.where(Inventory.branch_id == branch_id)
+    db.session.execute(delete)
+    db.session.execute(db.insert(LowStockItem).from_select(['product_id', 'branch_id'], low))
+
+def rebuild_low_stock():
+    """Recompute the whole low-stock set from inventory"""
+    db.session.execute(db.delete(LowStockItem))
+    db.session.execute(db.insert(LowStockItem).from_select(
+        ['product_id', 'branch_id'],
+        db.select(Inventory.product_id, Inventory.branch_id).join(
+            Product, Product.id == Inventory.product_id
+        ).where(
+            Product.is_active == True,
+            Product.track_inventory == True,
+            Inventory.quantity <= Product.min_stock
+        )
+    ))
+    db.session.commit()
+    return LowStockItem.query.count()
+
+def compute_reorder_suggestions():
+    """Forecast demand for every tracked product and branch and store what to reorder.
+
+    Stock levels and daily sales (from the product sales rollup) are each
+    read with one query and handed to NumPy as flat arrays; the previous
+    suggestions are replaced in a single transaction.
+    """
+    import numpy as np
+    from forecasting import daily_demand, reorder_quantities
+
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    n_days = current_app.config['FORECAST_HISTORY_DAYS']
+    first_day = started_at.date() - timedelta(days=n_days - 1)
+
+    def fetch_rows(statement):
+        # Raw DBAPI tuples: building millions of Row objects costs more than the
+        # query. Dates then arrive as the driver returns them (text on SQLite),
+        # which datetime64 parses either way.
+        return db.session.connection().execute(statement).cursor.fetchall()
+
+    stock = fetch_rows(
+        db.select(
+            Inventory.product_id, Inventory.branch_id, Inventory.quantity,
+            db.func.coalesce(Product.min_stock, 0), db.func.coalesce(Product.max_stock, 0),
+            db.func.coalesce(Product.box_qty, 1)
+        ).join(Product, Product.id == Inventory.product_id).where(
+            Product.is_active == True, Product.track_inventory == True
+        ).order_by(Inventory.product_id, Inventory.branch_id)
+    )
+
+    db.session.execute(db.delete(ReorderSuggestion))
+    suggestions = []
+    if stock:
+        product_ids, branch_ids, on_hand, min_stock, max_stock, box_qty = (
+            np.array(column, dtype=np.int64) for column in zip(*stock)
+        )
+        del stock
+        stride = int(branch_ids.max()) + 1
+        keys = product_ids * stride + branch_ids  # sorted, from the ORDER BY
+
+        sales = fetch_rows(
+            db.select(
+                ProductSalesRollup.product_id, ProductSalesRollup.branch_id,
+                ProductSalesRollup.day, ProductSalesRollup.quantity
+            ).where(ProductSalesRollup.day >= first_day, ProductSalesRollup.branch_id < stride)
+        )
+        if sales:
+            sale_product, sale_branch, sale_day, sale_quantity = zip(*sales)
+            del sales
+            sale_keys = np.array(sale_product, dtype=np.int64) * stride + np.array(sale_branch, dtype=np.int64)
+            pair_index = np.minimum(np.searchsorted(keys, sale_keys), len(keys) - 1)
+            known = keys[pair_index] == sale_keys  # sales of untracked or inactive products are ignored
+            day_index = (np.array(sale_day, dtype='datetime64[D]') - np.datetime64(first_day, 'D')).astype(np.int64)
+            demand = daily_demand(
+                pair_index[known], day_index[known], np.array(sale_quantity, dtype=np.float64)[known],
+                len(keys), n_days,
+                method=current_app.config['FORECAST_METHOD'],
+                alpha=current_app.config['FORECAST_ALPHA'],
+                window=current_app.config['FORECAST_WINDOW_DAYS']
+            )
+        else:
+            demand = np.zeros(len(keys))
+
+        suggested, days_of_cover = reorder_quantities(
+            on_hand, demand, min_stock, max_stock, box_qty,
+            lead_days=current_app.config['FORECAST_LEAD_DAYS'],
+            cover_days=current_app.config['FORECAST_COVER_DAYS']
+        )
+        for i in np.flatnonzero(suggested > 0).tolist():
+            cover = float(days_of_cover[i])
+            suggestions.append({
+                'product_id': int(product_ids[i]),
+                'branch_id': int(branch_ids[i]),
+                'on_hand': int(on_hand[i]),
+                'daily_demand': round(float(demand[i]), 4),
+                'days_of_cover': round(cover, 1) if np.isfinite(cover) else None,
+                'suggested_qty': int(suggested[i]),
+                'generated_at': started_at
+            })
+        if suggestions:
+            db.session.execute(db.insert(ReorderSuggestion), suggestions)
+
+    record_maintenance_run('forecast', started_at, started, len(suggestions))
+    db.session.commit()
+    return len(suggestions)
+
+def new_sale_id():
+    return f"SALE{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+
+def sale_totals(cart):
+    """Return ``(total_amount, tax_amount, discount_amount)`` for a cart"""
+    total_amount = sum(item['price'] * item['quantity'] for item in cart)
+    tax_amount = 0  # You can implement tax calculation here
+    discount_amount = 0  # You can implement discount calculation here
+    return total_amount, tax_amount, discount_amount
+
+def find_submitted_sales(keys):
+    """Map idempotency key to the transaction already recorded for it"""
+    if not keys:
+        return {}
+    rows = db.session.query(SaleSubmission.idempotency_key, Transaction.transaction_id, Transaction.total_amount).join(
+        Transaction, SaleSubmission.transaction_id == Transaction.id
+    ).filter(SaleSubmission.idempotency_key.in_(list(keys)))
+    return {key: {'transaction_id': transaction_id, 'total': total} for key, transaction_id, total in rows}
+
+def record_sale(transaction_id, cart, user_id, branch_id, customer_id=None, payment_method='cash',
+                total_amount=0, tax_amount=0, discount_amount=0, notes='', created_at=None,
+                idempotency_key=None, stock_deltas=None, rollup=None):
+    """Add a sale with its items, movements, stock changes and rollups to the session.
+
+    The caller owns the commit. Items and movements are bulk inserted and
+    inventory is updated with one statement for the whole basket. When
+    ``stock_deltas`` or ``rollup`` are given the stock and rollup changes are
+    added to them instead, so a batch of sales can apply them in one go.
+    """
+    transaction = Transaction(
+        transaction_id=transaction_id,
+        customer_id=customer_id,
+        user_id=user_id,
+        branch_id=branch_id,
+        total_amount=total_amount,
+        tax_amount=tax_amount,
+        discount_amount=discount_amount,
+        payment_method=payment_method,
+        notes=notes,
+        created_at=created_at or datetime.utcnow()
+    )
+    db.session.add(transaction)
+    db.session.flush()  # Get transaction.id
+
+    if idempotency_key:
+        db.session.add(SaleSubmission(idempotency_key=idempotency_key, transaction_id=transaction.id, user_id=user_id))
+
+    now = transaction.created_at
+    item_rows = []
+    movement_rows = []
+    deltas = {}
+    for item in cart:
+        product_id = int(item['product_id'])
+        quantity = item['quantity']
+        unit_price = item['price']
+
+        item_rows.append({
+            'transaction_id': transaction.id,
+            'product_id': product_id,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'discount': 0.0,
+            'total': unit_price * quantity
+        })
+        movement_rows.append({
+            'product_id': product_id,
+            'branch_id': branch_id,
+            'movement_type': 'sale',
+            'quantity': -quantity,  # Negative for stock out
+            'user_id': user_id,
+            'reason': 'Sale',
+            'notes': f'Sold in transaction {transaction_id}',
+            'created_at': now
+        })
+        deltas[product_id] = deltas.get(product_id, 0) + quantity
+
+    if stock_deltas is None:
+        apply_stock_deltas(branch_id, deltas, reject_negative=current_app.config['REJECT_NEGATIVE_STOCK'])
+    else:
+        for product_id, quantity in deltas.items():
+            stock_deltas[product_id] = stock_deltas.get(product_id, 0) + quantity
+
+    db.session.execute(db.insert(TransactionItem), item_rows)
+    db.session.execute(db.insert(ProductMovement), movement_rows)
+
+    sale_rollup = rollup if rollup is not None else SalesRollupDelta()
+    sale_rollup.add_sale(branch_id, transaction.created_at, total_amount, tax_amount, discount_amount,
+                         [(row['product_id'], row['quantity'], row['total']) for row in item_rows])
+    if rollup is None:
+        sale_rollup.apply()
+
+    return transaction
+
+# Sales rollup helpers
+def upsert_increment(model, key_columns, rows):
+    """Add each row's values to the matching rollup row, inserting missing keys.
+
+    Rows are applied in key order so concurrent writers lock rollup rows in
+    the same order.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    rows = sorted(rows, key=lambda row: tuple(row[column] for column in key_columns))
+    value_columns = [column for column in rows[0] if column not in key_columns]
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: table.c[column] + statement.excluded[column] for column in value_columns}
+        )
+        db.session.execute(statement, rows)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            table.update()
+            .where(db.and_(*[table.c[column] == row[column] for column in key_columns]))
+            .values({column: table.c[column] + row[column] for column in value_columns})
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(**row))
+
+class SalesRollupDelta:
+    """Collects rollup increments for one or more sales"""
+
+    def __init__(self):
+        self.sales = {}  # (branch_id, day, hour) -> totals
+        self.products = {}  # (branch_id, day, product_id) -> totals
+
+    def add_sale(self, branch_id, created_at, total_amount, tax_amount, discount_amount, lines):
+        """Count a sale; ``lines`` are ``(product_id, quantity, revenue)`` tuples"""
+        day = created_at.date()
+        totals = self.sales.setdefault((branch_id, day, created_at.hour), {
+            'total_amount': 0.0, 'tax_amount': 0.0, 'discount_amount': 0.0,
+            'transaction_count': 0, 'item_count': 0
+        })
+        totals['total_amount'] += total_amount or 0
+        totals['tax_amount'] += tax_amount or 0
+        totals['discount_amount'] += discount_amount or 0
+        totals['transaction_count'] += 1
+        for product_id, quantity, revenue in lines:
+            totals['item_count'] += quantity
+            product_totals = self.products.setdefault((branch_id, day, product_id), {'quantity': 0, 'revenue': 0.0})
+            product_totals['quantity'] += quantity
+            product_totals['revenue'] += revenue
+
+    def apply(self):
+        upsert_increment(SalesRollup, ['branch_id', 'day', 'hour'], [
+            {'branch_id': branch_id, 'day': day, 'hour': hour, **totals}
+            for (branch_id, day, hour), totals in self.sales.items()
+        ])
+        upsert_increment(ProductSalesRollup, ['branch_id', 'day', 'product_id'], [
+            {'branch_id': branch_id, 'day': day, 'product_id': product_id, **totals}
+            for (branch_id, day, product_id), totals in self.products.items()
+        ])
+
+def rebuild_sales_rollups():
+    """Recompute all rollups from the transaction history"""
+    SalesRollup.query.delete()
+    ProductSalesRollup.query.delete()
+
+    rollup = SalesRollupDelta()
+    lines = {}
+    items = db.session.query(
+        TransactionItem.transaction_id, TransactionItem.product_id, TransactionItem.quantity, TransactionItem.total
+    ).execution_options(yield_per=5000)
+    for transaction_id, product_id, quantity, total in items:
+        lines.setdefault(transaction_id, []).append((product_id, quantity, total))
+
+    transactions = db.session.query(
+        Transaction.id, Transaction.branch_id, Transaction.created_at, Transaction.total_amount,
+        Transaction.tax_amount, Transaction.discount_amount
+    ).execution_options(yield_per=5000)
+    count = 0
+    for transaction_id, branch_id, created_at, total_amount, tax_amount, discount_amount in transactions:
+        rollup.add_sale(branch_id, created_at, total_amount, tax_amount, discount_amount, lines.get(transaction_id, []))
+        count += 1
+
+    rollup.apply()
+    db.session.commit()
+    return count
+
+# Report helpers
+REPORT_TYPES = {
+    'sales': 'Sales Report',
+    'products': 'Product Performance',
+    'customers': 'Customer Analytics',
+    'inventory': 'Inventory Report',
+}
+
+_report_cache = OrderedDict()  # (report, branch_id, date_from, date_to) -> (fingerprint, result)
+_report_cache_lock = threading.Lock()
+
+def parse_report_range(date_from, date_to):
+    """Parse ``YYYY-MM-DD`` bounds, defaulting to the last 30 days (UTC)"""
+    today = datetime.utcnow().date()
+    try:
+        end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else today
+        start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else end - timedelta(days=29)
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    if start > end:
+        raise ValueError('Date From must not be after Date To')
+    return start, end
+
+def day_bounds(date_from, date_to):
+    return (datetime.combine(date_from, datetime.min.time()),
+            datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+
+def report_fingerprint(report, branch_id, date_from, date_to):
+    """Cheap summary of the data a report depends on; it changes whenever that data does.
+
+    Sales only ever add to the hourly rollup, so the row count and summed
+    transaction count over the range move with every sale that lands in it.
+    Reports that also read the catalog (product names and cost prices, the
+    inventory report's categories) or customer names and types add the
+    'catalog' or 'customers' version. The inventory report follows stock
+    levels instead of sales.
+    """
+    if report == 'inventory':
+        query = db.session.query(db.func.count(Inventory.id), db.func.max(Inventory.last_updated))
+        if branch_id:
+            query = query.filter(Inventory.branch_id == branch_id)
+        stock = tuple(query.one())
+        start, end = day_bounds(date_from, date_to)
+        query = db.session.query(db.func.count(ProductMovement.id)).filter(
+            ProductMovement.created_at >= start, ProductMovement.created_at < end
+        )
+        if branch_id:
+            query = query.filter(ProductMovement.branch_id == branch_id)
+        return stock + (query.scalar(), current_version('catalog'))
+
+    query = db.session.query(db.func.count(), db.func.sum(SalesRollup.transaction_count)).filter(
+        SalesRollup.day >= date_from, SalesRollup.day <= date_to
+    )
+    if branch_id:
+        query = query.filter(SalesRollup.branch_id == branch_id)
+    fingerprint = tuple(query.one())
+    if report == 'products':
+        fingerprint += (current_version('catalog'),)
+    elif report == 'customers':
+        fingerprint += (current_version('customers'),)
+    return fingerprint
+
+def sales_report(branch_id, date_from, date_to):
+    """Daily totals from the hourly rollup"""
+    query = db.session.query(
+        SalesRollup.day,
+        db.func.sum(SalesRollup.transaction_count),
+        db.func.sum(SalesRollup.item_count),
+        db.func.sum(SalesRollup.discount_amount),
+        db.func.sum(SalesRollup.tax_amount),
+        db.func.sum(SalesRollup.total_amount)
+    ).filter(SalesRollup.day >= date_from, SalesRollup.day <= date_to)
+    if branch_id:
+        query = query.filter(SalesRollup.branch_id == branch_id)
+    rows = [{
+        'day': day.isoformat(),
+        'transactions': transactions,
+        'items': items,
+        'discount': round(discount or 0, 2),
+        'tax': round(tax or 0, 2),
+        'total': round(total or 0, 2)
+    } for day, transactions, items, discount, tax, total in query.group_by(SalesRollup.day).order_by(SalesRollup.day)]
+    columns = [('day', 'Date'), ('transactions', 'Transactions'), ('items', 'Items'),
+               ('discount', 'Discounts'), ('tax', 'Tax'), ('total', 'Total')]
+    return columns, rows
+
+def product_performance_report(branch_id, date_from, date_to):
+    """Units and revenue per product from the daily product rollup"""
+    totals = db.session.query(
+        ProductSalesRollup.product_id.label('product_id'),
+        db.func.sum(ProductSalesRollup.quantity).label('quantity'),
+        db.func.sum(ProductSalesRollup.revenue).label('revenue')
+    ).filter(ProductSalesRollup.day >= date_from, ProductSalesRollup.day <= date_to)
+    if branch_id:
+        totals = totals.filter(ProductSalesRollup.branch_id == branch_id)
+    totals = totals.group_by(ProductSalesRollup.product_id).subquery()
+
+    query = db.session.query(
+        Product.id, Product.name, Product.sku, Product.cost_price, totals.c.quantity, totals.c.revenue
+    ).join(totals, totals.c.product_id == Product.id).order_by(
+        totals.c.revenue.desc()
+    ).limit(current_app.config['REPORT_MAX_ROWS'])
+    rows = []
+    for product_id, name, sku, cost_price, quantity, revenue in query:
+        cost = (cost_price or 0) * quantity
+        rows.append({
+            'product_id': product_id,
+            'name': name,
+            'sku': sku,
+            'quantity': quantity,
+            'revenue': round(revenue or 0, 2),
+            'margin': round((revenue or 0) - cost, 2) if cost_price is not None else None
+        })
+    columns = [('sku', 'SKU'), ('name', 'Product'), ('quantity', 'Units Sold'),
+               ('revenue', 'Revenue'), ('margin', 'Margin')]
+    return columns, rows
+
+def customer_analytics_report(branch_id, date_from, date_to):
+    """Purchase totals per customer; walk-in sales are grouped together"""
+    start, end = day_bounds(date_from, date_to)
+    totals = db.session.query(
+        Transaction.customer_id.label('customer_id'),
+        db.func.count(Transaction.id).label('transactions'),
+        db.func.sum(Transaction.total_amount).label('total'),
+        db.func.max(Transaction.created_at).label('last_purchase')
+    ).filter(Transaction.created_at >= start, Transaction.created_at < end)
+    if branch_id:
+        totals = totals.filter(Transaction.branch_id == branch_id)
+    totals = totals.group_by(Transaction.customer_id).subquery()
+
+    query = db.session.query(
+        totals.c.customer_id, Customer.name, Customer.customer_type,
+        totals.c.transactions, totals.c.total, totals.c.last_purchase
+    ).outerjoin(Customer, Customer.id == totals.c.customer_id).order_by(
+        totals.c.total.desc()
+    ).limit(current_app.config['REPORT_MAX_ROWS'])
+    rows = []
+    for customer_id, name, customer_type, transactions, total, last_purchase in query:
+        if isinstance(last_purchase, str):  # SQLite returns MAX() of a datetime as text
+            last_purchase = datetime.fromisoformat(last_purchase)
+        rows.append({
+            'customer_id': customer_id,
+            'name': name or 'Walk-in',
+            'customer_type': customer_type or '',
+            'transactions': transactions,
+            'total': round(total or 0, 2),
+            'average': round((total or 0) / transactions, 2) if transactions else 0,
+            'last_purchase': last_purchase.strftime('%Y-%m-%d %H:%M') if last_purchase else ''
+        })
+    columns = [('name', 'Customer'), ('customer_type', 'Type'), ('transactions', 'Transactions'),
+               ('total', 'Total Spent'), ('average', 'Average Order'), ('last_purchase', 'Last Purchase')]
+    return columns, rows
+
+def inventory_report(branch_id, date_from, date_to):
+    """Stock on hand per category, with stock movement totals for the range"""
+    start, end = day_bounds(date_from, date_to)
+    movements = db.session.query(
+        ProductMovement.product_id.label('product_id'),
+        db.func.sum(db.case((ProductMovement.quantity > 0, ProductMovement.quantity), else_=0)).label('units_in'),
+        db.func.sum(db.case((ProductMovement.quantity < 0, -ProductMovement.quantity), else_=0)).label('units_out')
+    ).filter(ProductMovement.created_at >= start, ProductMovement.created_at < end)
+    if branch_id:
+        movements = movements.filter(ProductMovement.branch_id == branch_id)
+    movements = movements.group_by(ProductMovement.product_id).subquery()
+
+    stock = db.session.query(
+        Inventory.product_id.label('product_id'),
+        db.func.sum(Inventory.quantity).label('quantity')
+    )
+    if branch_id:
+        stock = stock.filter(Inventory.branch_id == branch_id)
+    stock = stock.group_by(Inventory.product_id).subquery()
+
+    quantity = db.func.coalesce(stock.c.quantity, 0)
+    query = db.session.query(
+        Category.name,
+        db.func.count(Product.id),
+        db.func.sum(quantity),
+        db.func.sum(quantity * db.func.coalesce(Product.cost_price, 0)),
+        db.func.sum(quantity * Product.price),
+        db.func.sum(db.case((db.and_(Product.track_inventory == True, quantity <= Product.min_stock), 1), else_=0)),
+        db.func.sum(db.func.coalesce(movements.c.units_in, 0)),
+        db.func.sum(db.func.coalesce(movements.c.units_out, 0))
+    ).select_from(Product).outerjoin(stock, stock.c.product_id == Product.id).outerjoin(
+        movements, movements.c.product_id == Product.id
+    ).outerjoin(Category, Category.id == Product.category_id).filter(
+        Product.is_active == True
+    ).group_by(Category.name).order_by(Category.name)
+    rows = [{
+        'category': category or 'Uncategorized',
+        'products': products,
+        'quantity': units or 0,
+        'cost_value': round(cost_value or 0, 2),
+        'retail_value': round(retail_value or 0, 2),
+        'low_stock': low_stock or 0,
+        'units_in': units_in or 0,
+        'units_out': units_out or 0
+    } for category, products, units, cost_value, retail_value, low_stock, units_in, units_out in query]
+    columns = [('category', 'Category'), ('products', 'Products'), ('quantity', 'On Hand'),
+               ('cost_value', 'Cost Value'), ('retail_value', 'Retail Value'), ('low_stock', 'Low Stock'),
+               ('units_in', 'Units In'), ('units_out', 'Units Out')]
+    return columns, rows
+
+def sales_summary(branch_id, date_from, date_to):
+    """Headline figures shown above every report"""
+    query = db.session.query(
+        db.func.sum(SalesRollup.total_amount), db.func.sum(SalesRollup.transaction_count)
+    ).filter(SalesRollup.day >= date_from, SalesRollup.day <= date_to)
+    if branch_id:
+        query = query.filter(SalesRollup.branch_id == branch_id)
+    total_sales, total_transactions = query.one()
+
+    top = db.session.query(
+        ProductSalesRollup.product_id, db.func.sum(ProductSalesRollup.revenue).label('revenue')
+    ).filter(ProductSalesRollup.day >= date_from, ProductSalesRollup.day <= date_to)
+    if branch_id:
+        top = top.filter(ProductSalesRollup.branch_id == branch_id)
+    top = top.group_by(ProductSalesRollup.product_id).order_by(db.desc('revenue')).first()
+    top_product = db.session.get(Product, top[0]) if top else None
+
+    total_sales = round(total_sales or 0, 2)
+    total_transactions = total_transactions or 0
+    return [], [{
+        'total_sales': total_sales,
+        'total_transactions': total_transactions,
+        'average_order_value': round(total_sales / total_transactions, 2) if total_transactions else 0,
+        'top_product': top_product.name if top_product else None
+    }]
+
+REPORT_BUILDERS = {
+    'sales': sales_report,
+    'products': product_performance_report,
+    'customers': customer_analytics_report,
+    'inventory': inventory_report,
+    'summary': sales_summary,
+}
+
+def run_report(report, branch_id, date_from, date_to):
+    """Build a report, reusing the memoized result while its data is unchanged"""
+    key = (report, branch_id, date_from, date_to)
+    # Inventory follows stock levels, everything else follows sales in the range
+    fingerprint = report_fingerprint(report, branch_id, date_from, date_to)
+    with _report_cache_lock:
+        cached = _report_cache.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            _report_cache.move_to_end(key)
+            return cached[1]
+
+    columns, rows = REPORT_BUILDERS[report](branch_id, date_from, date_to)
+    result = {
+        'report': report,
+        'title': REPORT_TYPES.get(report, report),
+        'branch_id': branch_id,
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'columns': [{'key': key_, 'label': label} for key_, label in columns],
+        'rows': rows,
+        'generated_at': datetime.utcnow().isoformat()
+    }
+    with _report_cache_lock:
+        _report_cache[key] = (fingerprint, result)
+        _report_cache.move_to_end(key)
+        while len(_report_cache) > current_app.config['REPORT_CACHE_SIZE']:
+            _report_cache.popitem(last=False)
+    return result
+
+def report_request_args(args, report=None):
+    """Read report, branch and date range from query arguments"""
+    report = report or args.get('report', 'sales')
+    if report not in REPORT_TYPES:
+        raise ValueError('Unknown report type')
+    date_from, date_to = parse_report_range(args.get('date_from'), args.get('date_to'))
+    branch_id = args.get('branch', type=int) or None
+    return report, branch_id, date_from, date_to
+
+# Import helpers
+IMPORT_EXTENSIONS = ('csv', 'xlsx')
+
+def chunked(values, size=None):
+    """Split a sequence into lists of at most ``size`` items (``IMPORT_BATCH_SIZE`` by default)"""
+    size = size or current_app.config['IMPORT_BATCH_SIZE']
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def iter_upload_rows(upload):
+    """Yield ``(line_number, row)`` for each data row of an uploaded CSV or XLSX file.
+
+    Rows are streamed: openpyxl reads the sheet in read-only mode and CSV is
+    decoded as it is read. Keys are the lowercased header names with spaces
+    replaced by underscores; blank rows are skipped.
+    """
+    extension = upload.filename.rsplit('.', 1)[-1].lower() if '.' in upload.filename else ''
+    if extension not in IMPORT_EXTENSIONS:
+        raise ValueError('Upload a .csv or .xlsx file')
+
+    if extension == 'csv':
+        rows = csv.reader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''))
+    else:
+        import openpyxl
+        workbook = openpyxl.load_workbook(upload.stream, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+
+    header = None
+    for line_number, values in enumerate(rows, 1):
+        if not any(value not in (None, '') for value in values):
+            continue
+        if header is None:
+            header = [str(value or '').strip().lower().replace(' ', '_') for value in values]
+            continue
+        yield line_number, {key: value for key, value in zip(header, values) if key}
+
+    if header is None:
+        raise ValueError('The file is empty')
+
+def cell_text(value):
+    """Cell value as stripped text; whole-number floats from spreadsheets lose their '.0'"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def cell_int(value):
+    text = cell_text(value)
+    if not text:
+        raise ValueError('is required')
+    try:
+        return int(float(text))
+    except ValueError:
+        raise ValueError(f'"{text}" is not a number')
+
+def resolve_product_codes(codes):
+    """Map SKUs and barcodes to product ids with one lookup per batch of codes"""
+    resolved = {}
+    for batch in chunked(set(codes)):
+        resolved.update(db.session.query(Product.sku, Product.id).filter(Product.sku.in_(batch)))
+        for barcode, product_id in db.session.query(ProductBarcode.barcode, ProductBarcode.product_id).filter(
+            ProductBarcode.barcode.in_(batch)
+        ):
+            resolved.setdefault(barcode, product_id)  # a SKU match wins
+    return resolved
+
+def ensure_inventory_rows(branch_id, product_ids):
+    """Bulk insert empty inventory rows for products the branch has none for; returns their ids"""
+    existing = set()
+    for batch in chunked(set(product_ids)):
+        existing.update(product_id for product_id, in db.session.query(Inventory.product_id).filter(
+            Inventory.branch_id == branch_id, Inventory.product_id.in_(batch)
+        ))
+    missing = sorted(set(product_ids) - existing)
+    now = datetime.utcnow()
+    for batch in chunked(missing):
+        db.session.execute(db.insert(Inventory), [
+            {'product_id': product_id, 'branch_id': branch_id, 'quantity': 0, 'reserved_quantity': 0, 'last_updated': now}
+            for product_id in batch
+        ])
+    return missing
+
+def import_stock_take(rows, branch_id, user_id, apply=True):
+    """Apply a physical count: set branch stock to the counted quantities.
+
+    ``rows`` yields ``(line_number, row)`` with ``sku`` (or ``barcode``/``code``)
+    and ``quantity`` columns. Lines for the same product are added together,
+    so a product counted in several locations can appear more than once.
+    Each difference is written as an 'adjustment' movement and applied to
+    Inventory as a relative change in batched statements, so sales made
+    during the import are preserved. Valid lines are applied even when
+    others fail; with ``apply=False`` nothing is written. The caller commits.
+    """
+    errors = []
+    counts = {}  # code -> counted quantity
+    lines = 0
+    for line_number, row in rows:
+        lines += 1
+        code = cell_text(row.get('sku') or row.get('barcode') or row.get('code'))
+        if not code:
+            errors.append({'line': line_number, 'code': '', 'message': 'SKU or barcode is required'})
+            continue
+        try:
+            quantity = cell_int(row.get('quantity', row.get('counted')))
+        except ValueError as e:
+            errors.append({'line': line_number, 'code': code, 'message': f'Quantity {e}'})
+            continue
+        if quantity < 0:
+            errors.append({'line': line_number, 'code': code, 'message': 'Quantity cannot be negative'})
+            continue
+        counts.setdefault(code, []).append((line_number, quantity))
+
+    resolved = resolve_product_codes(counts)
+    counted = {}  # product_id -> quantity
+    for code, entries in counts.items():
+        product_id = resolved.get(code)
+        if product_id is None:
+            errors.extend({'line': line_number, 'code': code, 'message': 'Unknown SKU or barcode'}
+                          for line_number, _ in entries)
+            continue
+        counted[product_id] = counted.get(product_id, 0) + sum(quantity for _, quantity in entries)
+
+    on_hand = {}
+    for batch in chunked(counted):
+        on_hand.update(db.session.query(Inventory.product_id, Inventory.quantity).filter(
+            Inventory.branch_id == branch_id, Inventory.product_id.in_(batch)
+        ))
+    changes = {product_id: quantity - (on_hand.get(product_id) or 0)
+               for product_id, quantity in counted.items()
+               if quantity != (on_hand.get(product_id) or 0) or product_id not in on_hand}
+
+    summary = {
+        'lines': lines,
+        'products': len(counted),
+        'adjusted': sum(1 for delta in changes.values() if delta),
+        'unchanged': len(counted) - sum(1 for delta in changes.values() if delta),
+        'errors': errors,
+        'applied': apply
+    }
+    if not apply or not changes:
+        return summary
+
+    now = datetime.utcnow()
+    missing = ensure_inventory_rows(branch_id, [product_id for product_id in changes if product_id not in on_hand])
+
+    adjusted = sorted(product_id for product_id, delta in changes.items() if delta)
+    for batch in chunked(adjusted):
+        db.session.execute(db.insert(ProductMovement), [{
+            'product_id': product_id,
+            'branch_id': branch_id,
+            'movement_type': 'adjustment',
+            'quantity': changes[product_id],
+            'user_id': user_id,
+            'reason': 'Stock take',
+            'notes': f'Counted {counted[product_id]}, system had {on_hand.get(product_id) or 0}',
+            'created_at': now
+        } for product_id in batch])
+        # apply_stock_deltas subtracts, so pass the negated differences
+        apply_stock_deltas(branch_id, {product_id: -changes[product_id] for product_id in batch})
+    refresh_low_stock(missing, branch_id)
+    return summary
+
+# Catalog import helpers
+CATALOG_COLUMNS = ['sku', 'name', 'description', 'category', 'price', 'cost_price', 'min_stock', 'max_stock',
+                   'box_qty', 'barcodes', 'is_favorite', 'track_inventory', 'expiry_date']
+BARCODE_SEPARATORS = (';', '|', ',')
+
+def cell_float(value):
+    text = cell_text(value)
+    if not text:
+        raise ValueError('is required')
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f'"{text}" is not a number')
+
+def cell_bool(value, default=False):
+    text = cell_text(value).lower()
+    if not text:
+        return default
+    return text in ('1', 'true', 'yes', 'y')
+
+def split_barcodes(value):
+    """Barcodes from a cell holding one or more codes separated by ';', '|' or ','"""
+    text = cell_text(value)
+    for separator in BARCODE_SEPARATORS[1:]:
+        text = text.replace(separator, BARCODE_SEPARATORS[0])
+    return normalize_barcodes(text.split(BARCODE_SEPARATORS[0]))
+
+def parse_catalog_row(row):
+    """Product column values for an import row; raises ValueError naming the bad column"""
+    name = cell_text(row.get('name'))
+    if not name:
+        raise ValueError('Name is required')
+    values = {'name': name[:200], 'description': cell_text(row.get('description')) or None}
+    try:
+        values['price'] = cell_float(row.get('price'))
+    except ValueError as e:
+        raise ValueError(f'Price {e}')
+    if values['price'] < 0:
+        raise ValueError('Price cannot be negative')
+    for column, default in (('cost_price', None), ('min_stock', 0), ('max_stock', None), ('box_qty', 1)):
+        if not cell_text(row.get(column)):
+            values[column] = default
+            continue
+        try:
+            values[column] = cell_float(row.get(column)) if column == 'cost_price' else cell_int(row.get(column))
+        except ValueError as e:
+            raise ValueError(f"{column.replace('_', ' ').capitalize()} {e}")
+    values['box_qty'] = max(values['box_qty'], 1)
+    values['is_favorite'] = cell_bool(row.get('is_favorite'))
+    values['track_inventory'] = cell_bool(row.get('track_inventory'), default=True)
+
+    expiry = row.get('expiry_date')
+    if isinstance(expiry, datetime):
+        values['expiry_date'] = expiry.date()
+    elif cell_text(expiry):
+        try:
+            values['expiry_date'] = datetime.strptime(cell_text(expiry), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('Invalid expiry date format. Use YYYY-MM-DD')
+    else:
+        values['expiry_date'] = None
+    return values
+
+def import_catalog(rows, apply=True):
+    """Create products from a catalog sheet in batched statements.
+
+    ``rows`` yields ``(line_number, row)`` with the CATALOG_COLUMNS (only
+    ``sku``, ``name`` and ``price`` are required). SKUs and barcodes are
+    checked against the file and the database in one query per batch of
+    codes; a line that clashes is reported and skipped, the rest are
+    created. Missing categories are created by name. Products, barcode rows
+    and an empty inventory row per active branch are bulk inserted in
+    chunks and share one catalog version, so terminals, the search index
+    and the product cache pick them up like any other change. With
+    ``apply=False`` nothing is written. The caller commits.
+    """
+    errors = []
+    products = {}  # sku -> (line_number, values, barcodes, category name)
+    barcode_lines = {}  # barcode -> sku of the first line using it
+    lines = 0
+    for line_number, row in rows:
+        lines += 1
+        sku = cell_text(row.get('sku'))
+        if not sku:
+            errors.append({'line': line_number, 'code': '', 'message': 'SKU is required'})
+            continue
+        if len(sku) > 50:
+            errors.append({'line': line_number, 'code': sku, 'message': 'SKU is longer than 50 characters'})
+            continue
+        if sku in products:
+            errors.append({'line': line_number, 'code': sku, 'message': f'Duplicate SKU, first seen on line {products[sku][0]}'})
+            continue
+        try:
+            values = parse_catalog_row(row)
+        except ValueError as e:
+            errors.append({'line': line_number, 'code': sku, 'message': str(e)})
+            continue
+        barcodes = split_barcodes(row.get('barcodes', row.get('barcode')))
+        repeated = [barcode for barcode in barcodes if barcode in barcode_lines or len(barcode) > 64]
+        if repeated:
+            errors.append({'line': line_number, 'code': sku,
+                           'message': f"Barcode repeated in the file or too long: {', '.join(repeated)}"})
+            continue
+        barcode_lines.update((barcode, sku) for barcode in barcodes)
+        products[sku] = (line_number, values, barcodes, cell_text(row.get('category')))
+
+    existing_skus = set()
+    taken_barcodes = set()
+    for batch in chunked(products):
+        existing_skus.update(sku for sku, in db.session.query(Product.sku).filter(Product.sku.in_(batch)))
+    for batch in chunked(barcode_lines):
+        taken_barcodes.update(barcode for barcode, in db.session.query(ProductBarcode.barcode).filter(
+            ProductBarcode.barcode.in_(batch)
+        ))
+    for sku in sorted(existing_skus):
+        errors.append({'line': products[sku][0], 'code': sku, 'message': 'SKU already exists'})
+        del products[sku]
+    for sku in sorted({barcode_lines[barcode] for barcode in taken_barcodes} & set(products)):
+        conflicts = [barcode for barcode in products[sku][2] if barcode in taken_barcodes]
+        errors.append({'line': products[sku][0], 'code': sku,
+                       'message': f"Barcode already assigned to another product: {', '.join(conflicts)}"})
+        del products[sku]
+    errors.sort(key=lambda error: error['line'])
+
+    categories = {name.lower(): category_id for category_id, name in
+                  db.session.query(Category.id, Category.name).filter(Category.is_active == True)}
+    new_categories = {}
+    for _, _, _, category in products.values():
+        if category and category.lower() not in categories:
+            new_categories.setdefault(category.lower(), category[:100])
+
+    summary = {
+        'lines': lines,
+        'created': len(products),
+        'categories_created': len(new_categories),
+        'errors': errors,
+        'applied': apply
+    }
+    if not apply or not products:
+        return summary
+
+    for key, name in new_categories.items():
+        category = Category(name=name)
+        db.session.add(category)
+        db.session.flush()
+        categories[key] = category.id
+
+    now = datetime.utcnow()
+    version = bump_version('catalog')
+    branch_ids = [branch_id for branch_id, in db.session.query(Branch.id).filter(Branch.is_active == True)]
+    created = []
+    for batch in chunked(sorted(products, key=lambda sku: products[sku][0])):
+        product_rows = []
+        for sku in batch:
+            _, values, barcodes, category = products[sku]
+            product_rows.append(dict(
+                values,
+                sku=sku,
+                category_id=categories.get(category.lower()) if category else None,
+                barcodes=json.dumps(barcodes) if barcodes else None,
+                is_active=True,
+                created_at=now,
+                updated_at=now,
+                catalog_version=version
+            ))
+        ids = {sku: product_id for product_id, sku in db.session.execute(
+            db.insert(Product).returning(Product.id, Product.sku), product_rows
+        )}
+        barcode_rows = [{'product_id': ids[sku], 'barcode': barcode} for sku in batch for barcode in products[sku][2]]
+        if barcode_rows:
+            db.session.execute(db.insert(ProductBarcode), barcode_rows)
+        if branch_ids:
+            db.session.execute(db.insert(Inventory), [
+                {'product_id': ids[sku], 'branch_id': branch_id, 'quantity': 0, 'reserved_quantity': 0,
+                 'last_updated': now}
+                for sku in batch for branch_id in branch_ids
+            ])
+        created.extend(ids.values())
+
+    for batch in chunked(created):
+        refresh_low_stock(batch)
+    return summary
+
+def export_catalog_query():
+    query = db.session.query(
+        Product.sku, Product.name, Product.description, Category.name, Product.price, Product.cost_price,
+        Product.min_stock, Product.max_stock, Product.box_qty, Product.barcodes, Product.is_favorite,
+        Product.track_inventory, Product.expiry_date
+    ).outerjoin(Category, Category.id == Product.category_id).filter(Product.is_active == True)
+    return query.order_by(Product.id)
+
+def catalog_export_rows(rows):
+    """Catalog rows in CATALOG_COLUMNS order, with barcodes as one ';'-separated cell"""
+    for row in rows:
+        row = list(row)
+        barcodes = row[9]
+        if barcodes:
+            try:
+                barcodes = json.loads(barcodes)
+            except ValueError:
+                barcodes = [barcodes]
+            row[9] = BARCODE_SEPARATORS[0].join(normalize_barcodes(barcodes if isinstance(barcodes, list) else [barcodes]))
+        row[10] = 'yes' if row[10] else 'no'
+        row[11] = 'yes' if row[11] else 'no'
+        row[12] = row[12].isoformat() if row[12] else None
+        yield row
+
+# Transfer helpers
+def transfer_stock(from_branch_id, to_branch_id, quantities, user_id, notes=''):
+    """Move stock between branches in the current transaction.
+
+    ``quantities`` maps product_id to units moved. Each line gets a paired
+    'transfer' movement out of the source and into the destination, and both
+    inventories change through batched set-based updates. Branches are
+    updated in id order and products in id order within a branch, so
+    concurrent transfers lock rows in the same order and cannot deadlock
+    each other. Raises InsufficientStockError when ``REJECT_NEGATIVE_STOCK``
+    is set and the source runs short. The caller commits.
+    """
+    transfer_number = f"TRF{datetime.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:6].upper()}"
+    product_ids = sorted(quantities)
+    from_branch = db.session.get(Branch, from_branch_id)
+    to_branch = db.session.get(Branch, to_branch_id)
+    now = datetime.utcnow()
+
+    for branch_id in sorted((from_branch_id, to_branch_id)):
+        ensure_inventory_rows(branch_id, product_ids)
+        outbound = branch_id == from_branch_id
+        for batch in chunked(product_ids):
+            # apply_stock_deltas subtracts: positive leaves the source, negative arrives
+            apply_stock_deltas(
+                branch_id,
+                {product_id: quantities[product_id] if outbound else -quantities[product_id] for product_id in batch},
+                reject_negative=outbound and current_app.config['REJECT_NEGATIVE_STOCK']
+            )
+            db.session.execute(db.insert(ProductMovement), [{
+                'product_id': product_id,
+                'branch_id': branch_id,
+                'movement_type': 'transfer',
+                'quantity': -quantities[product_id] if outbound else quantities[product_id],
+                'user_id': user_id,
+                'reason': f'Transfer {transfer_number}',
+                'notes': (f'To {to_branch.name}' if outbound else f'From {from_branch.name}') + (f': {notes}' if notes else ''),
+                'created_at': now
+            } for product_id in batch])
+
+    return transfer_number
+
+# Export helpers
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+def export_transactions_query(branch_id, start, end):
+    query = db.session.query(
+        Transaction.transaction_id, Transaction.created_at, Transaction.branch_id, Transaction.user_id,
+        Transaction.customer_id, Transaction.payment_method, Transaction.status,
+        Transaction.total_amount, Transaction.tax_amount, Transaction.discount_amount
+    ).filter(Transaction.created_at >= start, Transaction.created_at < end)
+    if branch_id:
+        query = query.filter(Transaction.branch_id == branch_id)
+    header = ['Transaction ID', 'Date', 'Branch ID', 'User ID', 'Customer ID', 'Payment Method', 'Status',
+              'Total', 'Tax', 'Discount']
+    return header, query.order_by(Transaction.created_at, Transaction.id)
+
+def export_items_query(branch_id, start, end):
+    query = db.session.query(
+        Transaction.transaction_id, Transaction.created_at, Transaction.branch_id,
+        TransactionItem.product_id, Product.sku, Product.name,
+        TransactionItem.quantity, TransactionItem.unit_price, TransactionItem.discount, TransactionItem.total
+    ).join(Transaction, Transaction.id == TransactionItem.transaction_id).join(
+        Product, Product.id == TransactionItem.product_id
+    ).filter(Transaction.created_at >= start, Transaction.created_at < end)
+    if branch_id:
+        query = query.filter(Transaction.branch_id == branch_id)
+    header = ['Transaction ID', 'Date', 'Branch ID', 'Product ID', 'SKU', 'Product', 'Quantity', 'Unit Price',
+              'Discount', 'Total']
+    return header, query.order_by(Transaction.created_at, Transaction.id, TransactionItem.id)
+
+def export_movements_query(branch_id, start, end):
+    query = db.session.query(
+        ProductMovement.id, ProductMovement.created_at, ProductMovement.branch_id, ProductMovement.product_id,
+        Product.sku, ProductMovement.movement_type, ProductMovement.quantity, ProductMovement.user_id,
+        ProductMovement.reason, ProductMovement.notes
+    ).join(Product, Product.id == ProductMovement.product_id).filter(
+        ProductMovement.created_at >= start, ProductMovement.created_at < end
+    )
+    if branch_id:
+        query = query.filter(ProductMovement.branch_id == branch_id)
+    header = ['Movement ID', 'Date', 'Branch ID', 'Product ID', 'SKU', 'Type', 'Quantity', 'User ID',
+              'Reason', 'Notes']
+    return header, query.order_by(ProductMovement.created_at, ProductMovement.id)
+
+EXPORTS = {
+    'transactions': export_transactions_query,
+    'transaction_items': export_items_query,
+    'movements': export_movements_query,
+}
+
+def stream_rows(query):
+    """Iterate a query with a server-side cursor, holding one batch in memory at a time"""
+    return query.execution_options(yield_per=current_app.config['EXPORT_BATCH_SIZE'])
+
+def csv_chunks(header, rows):
+    """Yield CSV text in chunks of ``EXPORT_BATCH_SIZE`` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def xlsx_chunks(title, header, rows, chunk_size=64 * 1024):
+    """Build a write-only workbook on disk and yield it in chunks.
+
+    A write-only sheet streams rows to a temporary file, so memory stays
+    flat; the zip container can only be written once the last row is in.
+    """
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(list(row))
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# Receipt helpers
+def receipt_data(transaction_id):
+    """Everything printed on a receipt, as plain values the render workers can use"""
+    transaction = Transaction.query.filter_by(transaction_id=transaction_id).first()
+    if not transaction:
+        return None
+
+    items = db.session.query(
+        Product.name, TransactionItem.quantity, TransactionItem.unit_price, TransactionItem.total
+    ).join(Product, Product.id == TransactionItem.product_id).filter(
+        TransactionItem.transaction_id == transaction.id
+    ).order_by(TransactionItem.id).all()
+
+    branch = db.session.get(Branch, transaction.branch_id)
+    return {
+        'transaction_id': transaction.transaction_id,
+        'created_at': transaction.created_at.strftime('%Y-%m-%d %H:%M'),
+        'branch': {
+            'name': branch.name if branch else None,
+            'address': branch.address if branch else None,
+            'phone': branch.phone if branch else None
+        },
+        'cashier': transaction.user.username if transaction.user else None,
+        'customer': transaction.customer.name if transaction.customer else None,
+        'payment_method': transaction.payment_method,
+        'items': [{'name': name, 'quantity': quantity, 'unit_price': unit_price, 'total': total}
+                  for name, quantity, unit_price, total in items],
+        'total_amount': transaction.total_amount,
+        'tax_amount': transaction.tax_amount,
+        'discount_amount': transaction.discount_amount
+    }
+
+def prerender_receipt(transaction_id):
+    """Start rendering a new sale's receipt so the first print is a cache hit"""
+    if not current_app.config['RECEIPT_PRERENDER']:
+        return
+    try:
+        receipt = receipt_data(transaction_id)
+        if receipt:
+            current_app.extensions['receipt_renderer'].submit(receipt)
+    except ReceiptQueueFull:
+        pass  # rendered on demand instead
+
+def receipt_response(transaction_id, kind, mimetype):
+    try:
+        data = current_app.extensions['receipt_renderer'].get(
+            transaction_id, lambda: receipt_data(transaction_id), kind=kind,
+            timeout=current_app.config['RECEIPT_RENDER_TIMEOUT']
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid transaction id'}), 400
+    except (ReceiptQueueFull, FutureTimeoutError):
+        return jsonify({'success': False, 'message': 'Receipt is being rendered, try again shortly'}), 503
+
+    if data is None:
+        return jsonify({'success': False, 'message': 'Transaction not found'}), 404
+
+    return Response(data, mimetype=mimetype, headers={
+        'Content-Disposition': f'inline; filename={transaction_id}.{kind}',
+        'Cache-Control': 'private, max-age=86400'
+    })
@@ -0,0 +1,211 @@
+"""
+Versioned schema migrations.
+
+Each migration is a numbered list of idempotent operations, applied in order
+and recorded in the ``schema_migration`` table, so a database created by any
+earlier release is brought up to date in place. Operations are safe on a
+live database: new tables and nullable columns are cheap on SQLite and
+PostgreSQL alike, and on PostgreSQL indexes are built with CREATE INDEX
+CONCURRENTLY so sales keep writing while they build. Column and index
+definitions are looked up in the models' metadata, so a database made by
+``create_all`` and a migrated one end up with the same schema.
+"""
+
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn, CreateIndex as CreateIndexDDL
+
+migration_metadata = MetaData()
+schema_migration = Table(
+    'schema_migration', migration_metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+PG_MIGRATION_LOCK = 72061  # pg_advisory_lock key, so only one process migrates at a time
+
+
+class CreateTables:
+    """Create every model table that does not exist yet, with its indexes"""
+
+    def describe(self):
+        return 'create missing tables'
+
+    def apply(self, engine, metadata):
+        with engine.begin() as connection:
+            metadata.create_all(connection, checkfirst=True)
+
+
+class AddColumn:
+    """Add a model column to an existing table"""
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+
+    def describe(self):
+        return f'add column {self.table}.{self.column}'
+
+    def apply(self, engine, metadata):
+        column = metadata.tables[self.table].c[self.column]
+        with engine.begin() as connection:
+            existing = {c['name'] for c in inspect(connection).get_columns(self.table)}
+            if self.column in existing:
+                return
+            spec = CreateColumn(column).compile(dialect=engine.dialect)
+            connection.execute(text(f'ALTER TABLE {engine.dialect.identifier_preparer.format_table(column.table)} ADD COLUMN {spec}'))
+
+
+class CreateIndex:
+    """Build a model index, concurrently on PostgreSQL"""
+
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    def describe(self):
+        return f'create index {self.name} on {self.table}'
+
+    def apply(self, engine, metadata):
+        index = next((i for i in metadata.tables[self.table].indexes if i.name == self.name), None)
+        if index is None:
+            raise LookupError(f'No index {self.name} declared on {self.table}')
+
+        if engine.dialect.name != 'postgresql':
+            with engine.begin() as connection:
+                connection.execute(CreateIndexDDL(index, if_not_exists=True))
+            return
+
+        # CONCURRENTLY cannot run inside a transaction block; a build that was
+        # interrupted leaves an invalid index behind, which is dropped first
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            invalid = connection.execute(text(
+                'SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid '
+                'WHERE pg_class.relname = :name AND NOT pg_index.indisvalid'
+            ), {'name': self.name}).first()
+            if invalid:
+                connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {self.name}'))
+            ddl = str(CreateIndexDDL(index, if_not_exists=True).compile(dialect=engine.dialect))
+            connection.execute(text(re.sub(r'^CREATE (UNIQUE )?INDEX', r'CREATE \1INDEX CONCURRENTLY', ddl)))
+
+
+MIGRATIONS = [
+    (1, 'Tables for barcodes, rollups, stock ledger, counters and maintenance', [
+        CreateTables(),
+    ]),
+    (2, 'Catalog change tracking', [
+        AddColumn('product', 'catalog_version'),
+        CreateIndex('product', 'ix_product_catalog_version'),
+        CreateIndex('product', 'ix_product_updated_at'),
+    ]),
+    (3, 'Indexes for held transactions, sales history and stock movements', [
+        CreateIndex('held_transaction', 'ix_held_transaction_user_expires'),
+        CreateIndex('held_transaction', 'ix_held_transaction_expires_at'),
+        CreateIndex('transaction', 'ix_transaction_created_at'),
+        CreateIndex('transaction', 'ix_transaction_branch_created'),
+        CreateIndex('product_movement', 'ix_product_movement_created_at'),
+        CreateIndex('product_movement', 'ix_product_movement_branch_created'),
+        CreateIndex('inventory', 'ix_inventory_last_updated'),
+    ]),
+    (4, 'Indexes for list views, lookups and joins', [
+        CreateIndex('product', 'ix_product_active_name'),
+        CreateIndex('product', 'ix_product_active_created'),
+        CreateIndex('product', 'ix_product_category_id'),
+        CreateIndex('inventory', 'ix_inventory_branch_product'),
+        CreateIndex('product_movement', 'ix_product_movement_product_created'),
+        CreateIndex('transaction_item', 'ix_transaction_item_transaction_id'),
+        CreateIndex('purchase_invoice', 'ix_purchase_invoice_created_at'),
+        CreateIndex('purchase_invoice', 'ix_purchase_invoice_status_created'),
+        CreateIndex('purchase_invoice', 'ix_purchase_invoice_supplier_id'),
+        CreateIndex('purchase_invoice_item', 'ix_purchase_invoice_item_purchase_invoice_id'),
+    ]),
+]
+
+
+def applied_versions(engine):
+    """Versions already recorded in ``schema_migration``"""
+    with engine.begin() as connection:
+        schema_migration.create(connection, checkfirst=True)
+        return {row.version for row in connection.execute(schema_migration.select())}
+
+
+def migration_status(engine):
+    """``(version, name, applied_at)`` for every migration; ``applied_at`` is None when pending"""
+    with engine.begin() as connection:
+        schema_migration.create(connection, checkfirst=True)
+        applied = {row.version: row.applied_at for row in connection.execute(schema_migration.select())}
+    return [(version, name, applied.get(version)) for version, name, _ in MIGRATIONS]
+
+
+def migrate(engine, metadata, log=None):
+    """Apply pending migrations in order and return their versions"""
+    lock = None
+    if engine.dialect.name == 'postgresql':
+        lock = engine.connect()
+        lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': PG_MIGRATION_LOCK})
+    try:
+        done = applied_versions(engine)
+        applied = []
+        for version, name, operations in MIGRATIONS:
+            if version in done:
+                continue
+            for operation in operations:
+                if log:
+                    log(f'[{version}] {operation.describe()}')
+                operation.apply(engine, metadata)
+            try:
+                with engine.begin() as connection:
+                    connection.execute(schema_migration.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    ))
+            except IntegrityError:
+                pass  # recorded by another process; every operation is idempotent
+            applied.append(version)
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': PG_MIGRATION_LOCK})
+            lock.close()
+
+
+# Query plan checks
+ALIAS_RE = re.compile(r'"?(\w+)"?\s+AS\s+"?(\w+)"?', re.IGNORECASE)
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$')
+
+
+def full_scans(connection, statement, parameters, tables):
+    """Names in ``tables`` that the plan for ``statement`` reads with a full table scan.
+
+    On SQLite a plain ``SCAN`` of a table counts; scans that walk an index
+    (to return rows in order or count them) do not. On PostgreSQL the plan
+    is taken with sequential scans disabled, so a ``Seq Scan`` that remains
+    means no index can serve the query.
+    """
+    found = set()
+    if connection.dialect.name == 'sqlite':
+        aliases = {alias: table for table, alias in ALIAS_RE.findall(statement)}
+        for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+            match = SQLITE_SCAN_RE.match(row[-1])
+            if match:
+                name = aliases.get(match.group(2) or match.group(1), match.group(1))
+                if name in tables:
+                    found.add(name)
+    elif connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET enable_seqscan = off')
+        try:
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        finally:
+            connection.exec_driver_sql('RESET enable_seqscan')
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') in tables:
+                found.add(node['Relation Name'])
+            nodes.extend(node.get('Plans', []))
+    return found
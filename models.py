@@ -0,0 +1,361 @@
+"""
+Database models.
+"""
+
+from flask_login import UserMixin
+from datetime import datetime, timedelta
+import json
+from extensions import db, login_manager
+
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
+
+def normalize_barcodes(values):
+    """Strip blanks and duplicates from a list of barcodes, keeping order"""
+    barcodes = []
+    for value in values or []:
+        barcode = str(value).strip()
+        if barcode and barcode not in barcodes:
+            barcodes.append(barcode)
+    return barcodes
+
+# Database Models
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
+    role = db.Column(db.String(20), nullable=False, default='cashier')  # admin, manager, cashier, inventory_manager
+    is_active = db.Column(db.Boolean, default=True)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_login = db.Column(db.DateTime, nullable=True)
+
+    branch = db.relationship('Branch', backref=db.backref('users', lazy=True))
+
+class Branch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    address = db.Column(db.Text, nullable=True)
+    phone = db.Column(db.String(20), nullable=True)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Category(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    parent = db.relationship('Category', remote_side=[id], backref=db.backref('subcategories', lazy=True))
+
+class Product(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    sku = db.Column(db.String(50), unique=True, nullable=False)
+    barcodes = db.Column(db.Text, nullable=True)  # JSON array of barcodes
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True, index=True)
+    price = db.Column(db.Float, nullable=False)
+    cost_price = db.Column(db.Float, nullable=True)
+    image = db.Column(db.String(255), nullable=True)
+    is_active = db.Column(db.Boolean, default=True)
+    track_inventory = db.Column(db.Boolean, default=True)
+    min_stock = db.Column(db.Integer, default=0)
+    max_stock = db.Column(db.Integer, nullable=True)
+    # New fields
+    box_qty = db.Column(db.Integer, default=1)  # Units per box
+    is_favorite = db.Column(db.Boolean, default=False)  # Favorite product
+    expiry_date = db.Column(db.Date, nullable=True)  # Expiration date
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    catalog_version = db.Column(db.Integer, default=0, index=True)  # 'catalog' counter value at last change
+
+    category = db.relationship('Category', backref=db.backref('products', lazy=True))
+    inventories = db.relationship('Inventory', backref='product', lazy=True)
+    barcode_entries = db.relationship('ProductBarcode', backref='product', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_product_active_name', 'is_active', 'name'),
+        db.Index('ix_product_active_created', 'is_active', 'created_at'),
+    )
+
+    @property
+    def barcode_list(self):
+        """Get barcodes as a list"""
+        if self.barcodes:
+            try:
+                return json.loads(self.barcodes)
+            except:
+                return [self.barcodes] if self.barcodes else []
+        return []
+
+    @barcode_list.setter
+    def barcode_list(self, value):
+        """Set barcodes from a list and keep the barcode table in sync"""
+        if isinstance(value, list):
+            self.barcodes = json.dumps(normalize_barcodes(value))
+        else:
+            self.barcodes = json.dumps(normalize_barcodes([value])) if value else None
+
+        # Reuse rows for barcodes that stay so the unique index never sees a
+        # delete and re-insert of the same value in one flush
+        existing = {entry.barcode: entry for entry in self.barcode_entries}
+        self.barcode_entries = [
+            existing.get(barcode) or ProductBarcode(barcode=barcode)
+            for barcode in normalize_barcodes(self.barcode_list)
+        ]
+
+class ProductBarcode(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    barcode = db.Column(db.String(64), unique=True, nullable=False)  # unique index, exact lookups only
+
+class Inventory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    quantity = db.Column(db.Integer, default=0)
+    reserved_quantity = db.Column(db.Integer, default=0)
+    last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    branch = db.relationship('Branch', backref=db.backref('inventories', lazy=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'branch_id', name='unique_product_branch'),
+        db.Index('ix_inventory_branch_product', 'branch_id', 'product_id'),
+        db.Index('ix_inventory_last_updated', 'last_updated'),
+    )
+
+class Customer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    email = db.Column(db.String(120), nullable=True)
+    phone = db.Column(db.String(20), nullable=True)
+    address = db.Column(db.Text, nullable=True)
+    customer_type = db.Column(db.String(20), default='regular')  # regular, vip, wholesale
+    loyalty_points = db.Column(db.Integer, default=0)
+    total_purchases = db.Column(db.Float, default=0.0)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    birthday = db.Column(db.Date, nullable=True)
+
+class Transaction(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.String(50), unique=True, nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    tax_amount = db.Column(db.Float, default=0.0)
+    discount_amount = db.Column(db.Float, default=0.0)
+    payment_method = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='completed')  # completed, cancelled, refunded
+    notes = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    customer = db.relationship('Customer', backref=db.backref('transactions', lazy=True))
+    user = db.relationship('User', backref=db.backref('transactions', lazy=True))
+    branch = db.relationship('Branch', backref=db.backref('transactions', lazy=True))
+    items = db.relationship('TransactionItem', backref='transaction', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_transaction_created_at', 'created_at'),
+        db.Index('ix_transaction_branch_created', 'branch_id', 'created_at'),
+    )
+
+class SaleSubmission(db.Model):
+    """Client idempotency key of a submitted sale, so replays are recognised"""
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    transaction = db.relationship('Transaction')
+
+class TransactionItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)
+    discount = db.Column(db.Float, default=0.0)
+    total = db.Column(db.Float, nullable=False)
+
+    product = db.relationship('Product', backref=db.backref('transaction_items', lazy=True))
+
+class SalesRollup(db.Model):
+    """Sales totals per branch and hour, kept current by record_sale"""
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    tax_amount = db.Column(db.Float, nullable=False, default=0.0)
+    discount_amount = db.Column(db.Float, nullable=False, default=0.0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index('ix_sales_rollup_day', 'day'),)
+
+class ProductSalesRollup(db.Model):
+    """Units and revenue per branch, day and product, kept current by record_sale"""
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (db.Index('ix_product_sales_rollup_day_product', 'day', 'product_id'),)
+
+class HeldTransaction(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.String(50), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    cart_data = db.Column(db.Text, nullable=False)  # JSON string
+    customer_data = db.Column(db.Text, nullable=True)  # JSON string
+    notes = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(days=7))
+
+    user = db.relationship('User', backref=db.backref('held_transactions', lazy=True))
+    branch = db.relationship('Branch', backref=db.backref('held_transactions', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_held_transaction_user_expires', 'user_id', 'expires_at'),
+        db.Index('ix_held_transaction_expires_at', 'expires_at'),
+    )
+
+class HeldTransactionArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # same id as the original hold
+    transaction_id = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    cart_data = db.Column(db.Text, nullable=False)  # JSON string
+    customer_data = db.Column(db.Text, nullable=True)  # JSON string
+    notes = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Supplier(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    email = db.Column(db.String(120), nullable=True)
+    phone = db.Column(db.String(20), nullable=True)
+    address = db.Column(db.Text, nullable=True)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SupportTicket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    priority = db.Column(db.String(20), default='medium')  # low, medium, high, urgent
+    status = db.Column(db.String(20), default='open')  # open, in_progress, resolved, closed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('created_tickets', lazy=True))
+    assignee = db.relationship('User', foreign_keys=[assigned_to], backref=db.backref('assigned_tickets', lazy=True))
+
+class PurchaseInvoice(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_number = db.Column(db.String(50), unique=True, nullable=False)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    invoice_date = db.Column(db.Date, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    tax_amount = db.Column(db.Float, default=0.0)
+    discount_amount = db.Column(db.Float, default=0.0)
+    notes = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), default='draft')  # draft, completed, cancelled
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    supplier = db.relationship('Supplier', backref=db.backref('purchase_invoices', lazy=True))
+    user = db.relationship('User', backref=db.backref('purchase_invoices', lazy=True))
+    branch = db.relationship('Branch', backref=db.backref('purchase_invoices', lazy=True))
+    items = db.relationship('PurchaseInvoiceItem', backref='invoice', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_purchase_invoice_created_at', 'created_at'),
+        db.Index('ix_purchase_invoice_status_created', 'status', 'created_at'),
+    )
+
+class PurchaseInvoiceItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    purchase_invoice_id = db.Column(db.Integer, db.ForeignKey('purchase_invoice.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+
+    product = db.relationship('Product', backref=db.backref('purchase_invoice_items', lazy=True))
+
+class ProductMovement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False)
+    movement_type = db.Column(db.String(20), nullable=False)  # purchase, sale, return, transfer, adjustment
+    quantity = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    reason = db.Column(db.Text, nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    product = db.relationship('Product', backref=db.backref('movements', lazy=True))
+    branch = db.relationship('Branch', backref=db.backref('movements', lazy=True))
+    user = db.relationship('User', backref=db.backref('movements', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_product_movement_created_at', 'created_at'),
+        db.Index('ix_product_movement_branch_created', 'branch_id', 'created_at'),
+        db.Index('ix_product_movement_product_created', 'product_id', 'created_at'),
+    )
+
+class HeldTransactionCount(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0, index=True)  # 'held' counter value at last change
+
+class MaintenanceRun(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=True)
+    rows = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+class LowStockItem(db.Model):
+    """Inventory rows at or below their product's minimum stock, kept by refresh_low_stock"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), primary_key=True, index=True)
+
+class StockCheckpoint(db.Model):
+    """Stock per product and branch implied by all movements up to the 'ledger_checkpoint' movement id"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class ReorderSuggestion(db.Model):
+    """Output of the last forecast run, one row per product and branch to reorder"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), primary_key=True, index=True)
+    on_hand = db.Column(db.Integer, nullable=False)
+    daily_demand = db.Column(db.Float, nullable=False)
+    days_of_cover = db.Column(db.Float, nullable=True)  # None when there is no demand
+    suggested_qty = db.Column(db.Integer, nullable=False)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    product = db.relationship('Product')
+    branch = db.relationship('Branch')
+
+class VersionCounter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,180 @@
+"""
+Keyset (cursor) pagination.
+
+A page is selected with a WHERE on the sort key of the last row already
+shown instead of an OFFSET, so every page costs one index range scan however
+deep it is. The cursor handed to clients is an opaque URL-safe token holding
+that key and the direction to move in. Totals are not needed to page; when
+a view shows one it comes from ``CountCache``, which keeps recent counts for
+a short time instead of running COUNT(*) on every page.
+"""
+
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor token that was not produced by ``encode_cursor``"""
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    if value is None or column is None:
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values, direction='next'):
+    """Opaque token for the sort key ``values`` of a row"""
+    payload = json.dumps({'k': [_dump_value(value) for value in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, keys):
+    """``(values, direction)`` from a cursor token for the given sort ``keys``"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values, direction = payload['k'], payload['d']
+        if direction not in ('next', 'prev') or len(values) != len(keys):
+            raise ValueError
+        return [_load_value(column, value) for column, value in zip(keys, values)], direction
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidCursor('Invalid page cursor')
+
+
+class KeysetPage:
+    """One page of rows with cursors to the neighbouring pages"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=20, descending=False, key_func=None, total=None):
+    """Fetch the page of ``query`` after (or before) ``cursor``.
+
+    ``keys`` are the sort columns, all in the same direction, and must end
+    with a unique column (usually the id) so no two rows share a key. The
+    query must not be ordered already. ``key_func(item)`` returns a row's
+    key values; by default they are read as attributes named after the key
+    columns. Raises InvalidCursor for a malformed cursor.
+    """
+    if key_func is None:
+        names = [column.key for column in keys]
+        key_func = lambda item: tuple(getattr(item, name) for name in names)
+
+    direction = 'next'
+    if cursor:
+        values, direction = decode_cursor(cursor, keys)
+        forward = direction == 'next'
+        key = tuple_(*keys) if len(keys) > 1 else keys[0]
+        bound = tuple_(*values) if len(keys) > 1 else values[0]
+        query = query.filter(key < bound if forward == descending else key > bound)
+
+    backward = direction == 'prev'
+    order = [column.desc() if descending != backward else column.asc() for column in keys]
+    items = query.order_by(*order).limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backward:
+        items.reverse()
+
+    # Moving back from a cursor means there are rows after this page, and
+    # moving forward from one means there are rows before it
+    has_next = more if not backward else True
+    has_prev = more if backward else bool(cursor)
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_next:
+            next_cursor = encode_cursor(key_func(items[-1]), 'next')
+        if has_prev:
+            prev_cursor = encode_cursor(key_func(items[0]), 'prev')
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
+
+
+def paginate_ids(ids, load, cursor=None, per_page=20):
+    """Page through ``ids`` in their given order, such as a ranked search result.
+
+    The cursor holds a position in ``ids``. ``load(page_ids)`` returns the
+    rows for one page in any order, each with an ``id``; ids without a row
+    (removed since they were ranked) are skipped. The total is the length
+    of ``ids``. Raises InvalidCursor for a malformed cursor.
+    """
+    start = 0
+    if cursor:
+        (start,), _ = decode_cursor(cursor, [None])
+        if not isinstance(start, int) or start < 0:
+            raise InvalidCursor('Invalid page cursor')
+
+    page_ids = ids[start:start + per_page]
+    rows = {row.id: row for row in load(page_ids)} if page_ids else {}
+    items = [rows[product_id] for product_id in page_ids if product_id in rows]
+
+    next_cursor = encode_cursor([start + per_page]) if start + per_page < len(ids) else None
+    prev_cursor = encode_cursor([max(start - per_page, 0)]) if start > 0 else None
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, len(ids))
+
+
+class CountCache:
+    """Short-lived LRU of row counts keyed by the compiled count query"""
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()  # key -> (expires_at, count)
+
+    def count(self, query):
+        """Rows matched by ``query``, from the cache when counted less than ``ttl`` seconds ago"""
+        query = query.order_by(None)
+        compiled = query.statement.compile()
+        key = (str(compiled), repr(sorted(compiled.params.items())))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached and cached[0] > now:
+                self._counts.move_to_end(key)
+                return cached[1]
+        total = query.count()
+        with self._lock:
+            self._counts[key] = (now + self.ttl, total)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
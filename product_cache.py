@@ -0,0 +1,116 @@
+"""
+Process-local LRU cache of product records.
+
+Records are plain dicts looked up by product id or SKU. Entries are tied to
+the catalog version they were read at; the owner calls ``sync`` with the
+current version and the ids changed since, and only those are evicted.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ProductCache:
+    """Bounded LRU of product records keyed by id and SKU"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._records = OrderedDict()  # product_id -> record, least recently used first
+        self._sku_index = {}  # sku -> product_id
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, product_id):
+        with self._lock:
+            record = self._records.get(product_id)
+            if record is None:
+                self.misses += 1
+                return None
+            self._records.move_to_end(product_id)
+            self.hits += 1
+            return record
+
+    def get_by_sku(self, sku):
+        with self._lock:
+            product_id = self._sku_index.get(sku)
+            if product_id is None:
+                self.misses += 1
+                return None
+        return self.get(product_id)
+
+    def get_many(self, product_ids):
+        """Return ``(found, missing)``: a dict of cached records and the ids to load"""
+        found = {}
+        missing = []
+        for product_id in product_ids:
+            record = self.get(product_id)
+            if record is None:
+                missing.append(product_id)
+            else:
+                found[product_id] = record
+        return found, missing
+
+    def put(self, record, version=None):
+        """Store a record read at catalog ``version``; stale reads are dropped"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._discard(record['id'])
+            self._records[record['id']] = record
+            self._sku_index[record['sku']] = record['id']
+            while len(self._records) > self.maxsize:
+                product_id, evicted = self._records.popitem(last=False)
+                self._drop_sku(product_id, evicted['sku'])
+                self.evictions += 1
+
+    def invalidate(self, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                if self._discard(product_id):
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._records)
+            self._records.clear()
+            self._sku_index.clear()
+
+    def sync(self, version, changed_ids=None):
+        """Move to catalog ``version``, evicting ``changed_ids`` or everything when not given"""
+        if changed_ids is None:
+            self.clear()
+        else:
+            self.invalidate(changed_ids)
+        self.version = version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._records),
+                'maxsize': self.maxsize,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _discard(self, product_id):
+        record = self._records.pop(product_id, None)
+        if record is None:
+            return False
+        self._drop_sku(product_id, record['sku'])
+        return True
+
+    def _drop_sku(self, product_id, sku):
+        if self._sku_index.get(sku) == product_id:
+            del self._sku_index[sku]
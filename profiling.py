@@ -0,0 +1,232 @@
+"""
+Request profiling and Prometheus metrics.
+
+``RequestProfiler`` times every request and, through SQLAlchemy engine
+events, every SQL statement. A request's statements are counted and timed
+in a thread-local, so the per-route figures cost a few dictionary updates
+and no extra queries. Everything is kept in fixed-bucket histograms in
+process memory and rendered in the Prometheus text format on demand.
+
+Statements slower than ``slow_query_ms`` are logged with their string and
+number literals replaced by ``?`` and their bound parameters reduced to type
+names, so the log never holds customer data. Requests slower than
+``slow_request_ms`` or running more than ``statement_warn`` statements (an
+N+1 loop, usually) are logged with their statement count.
+
+Metrics are per process: with several workers each scrape reads the worker
+that served it.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+WHITESPACE_RE = re.compile(r'\s+')
+MAX_LOGGED_STATEMENT = 2000
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """Fixed-bucket histogram with one series per label value tuple"""
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, label_values=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+        for label_values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one series per label value tuple"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._series.items())
+        for label_values, value in snapshot:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+def redact_statement(statement):
+    """SQL text with string and number literals replaced by ``?``, on one line"""
+    statement = STRING_LITERAL_RE.sub('?', statement)
+    statement = NUMBER_LITERAL_RE.sub('?', statement)
+    statement = WHITESPACE_RE.sub(' ', statement).strip()
+    if len(statement) > MAX_LOGGED_STATEMENT:
+        statement = statement[:MAX_LOGGED_STATEMENT] + '...'
+    return statement
+
+
+def redact_parameters(parameters, executemany=False):
+    """Describe bound parameters by type only"""
+    if executemany:
+        return f'{len(parameters)} rows'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+    return type(parameters).__name__
+
+
+class RequestProfiler:
+    """Per-route latency and SQL metrics for a Flask app and its engine"""
+
+    def __init__(self, app, engine, prefix='pos', slow_query_ms=200, slow_request_ms=1000, statement_warn=50):
+        self.logger = app.logger
+        self.slow_query = slow_query_ms / 1000
+        self.slow_request = slow_request_ms / 1000
+        self.statement_warn = statement_warn
+        self._local = threading.local()
+
+        self.request_duration = Histogram(
+            f'{prefix}_http_request_duration_seconds', 'Time to handle a request.',
+            LATENCY_BUCKETS, ('endpoint', 'method', 'status')
+        )
+        self.request_statements = Histogram(
+            f'{prefix}_http_request_sql_statements', 'SQL statements run by a request.',
+            COUNT_BUCKETS, ('endpoint',)
+        )
+        self.request_sql_duration = Histogram(
+            f'{prefix}_http_request_sql_duration_seconds', 'Time a request spent in SQL statements.',
+            LATENCY_BUCKETS, ('endpoint',)
+        )
+        self.statement_duration = Histogram(
+            f'{prefix}_sql_statement_duration_seconds', 'Time to execute one SQL statement.',
+            STATEMENT_BUCKETS
+        )
+        self.slow_statements = Counter(f'{prefix}_sql_slow_statements_total', 'SQL statements slower than the slow query threshold.')
+        self.metrics = [
+            self.request_duration, self.request_statements, self.request_sql_duration,
+            self.statement_duration, self.slow_statements,
+        ]
+
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _start_request(self):
+        state = self._local
+        state.started = time.perf_counter()
+        state.statements = 0
+        state.sql_seconds = 0.0
+        state.status = None
+        state.active = True
+
+    def _record_status(self, response):
+        # Teardown sees no response, so keep the status for it
+        self._local.status = response.status_code
+        return response
+
+    def _finish_request(self, error=None):
+        state = self._local
+        if not getattr(state, 'active', False):
+            return
+        state.active = False
+        elapsed = time.perf_counter() - state.started
+        endpoint = request.endpoint or 'unmatched'
+        status = state.status or (500 if error is not None else 200)
+
+        self.request_duration.observe(elapsed, (endpoint, request.method, str(status)))
+        self.request_statements.observe(state.statements, (endpoint,))
+        self.request_sql_duration.observe(state.sql_seconds, (endpoint,))
+
+        if elapsed >= self.slow_request or state.statements > self.statement_warn:
+            self.logger.warning(
+                'Request %s %s -> %s took %.0f ms with %d SQL statements (%.0f ms)',
+                request.method, request.path, status, elapsed * 1000, state.statements, state.sql_seconds * 1000
+            )
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['profile_started'].pop()
+        elapsed = time.perf_counter() - started
+        self.statement_duration.observe(elapsed)
+
+        state = self._local
+        if getattr(state, 'active', False):
+            state.statements += 1
+            state.sql_seconds += elapsed
+
+        if elapsed >= self.slow_query:
+            self.slow_statements.inc()
+            self.logger.warning(
+                'Slow query %.1f ms: %s parameters=%s',
+                elapsed * 1000, redact_statement(statement), redact_parameters(parameters, executemany)
+            )
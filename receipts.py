@@ -0,0 +1,185 @@
+"""
+Receipt rendering.
+
+Receipts are rendered from plain dicts (no database access) into a PDF with
+a QR code of the transaction id. Rendering runs on a bounded thread pool
+and the output is written to a disk cache keyed by transaction id and
+``RECEIPT_TEMPLATE_VERSION``, so a reprint is a file read. Bump the version
+whenever the layout changes; old renders are then simply never looked up.
+ReportLab and qrcode are imported by the render functions, so processes that
+never render a receipt do not load them.
+"""
+
+import io
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+RECEIPT_TEMPLATE_VERSION = 1
+RECEIPT_WIDTH_MM = 80  # thermal roll
+
+SAFE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class ReceiptQueueFull(Exception):
+    """Raised when too many renders are already waiting for a worker"""
+
+
+def render_qr_png(data, box_size=4):
+    """PNG bytes of a QR code for ``data``"""
+    import qrcode
+
+    qr = qrcode.QRCode(box_size=box_size, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    output = io.BytesIO()
+    qr.make_image(fill_color='black', back_color='white').save(output, format='PNG')
+    return output.getvalue()
+
+
+def render_receipt_pdf(receipt):
+    """PDF bytes for a receipt dict.
+
+    ``receipt`` holds ``transaction_id``, ``created_at`` (text), ``branch``
+    (name, address, phone), ``cashier``, ``customer``, ``payment_method``,
+    ``items`` (name, quantity, unit_price, total) and the sale totals.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    title = styles['Title'].clone('ReceiptTitle', fontSize=12, leading=14, spaceAfter=2)
+    small = styles['Normal'].clone('ReceiptSmall', fontSize=7, leading=9)
+
+    branch = receipt.get('branch') or {}
+    story = [Paragraph(branch.get('name') or 'Receipt', title)]
+    for line in (branch.get('address'), branch.get('phone')):
+        if line:
+            story.append(Paragraph(line, small))
+    story.append(Spacer(1, 2 * mm))
+    story.append(Paragraph(f"Receipt: {receipt['transaction_id']}", small))
+    story.append(Paragraph(f"Date: {receipt['created_at']}", small))
+    if receipt.get('cashier'):
+        story.append(Paragraph(f"Cashier: {receipt['cashier']}", small))
+    if receipt.get('customer'):
+        story.append(Paragraph(f"Customer: {receipt['customer']}", small))
+    story.append(Spacer(1, 2 * mm))
+
+    rows = [['Item', 'Qty', 'Price', 'Total']]
+    for item in receipt['items']:
+        rows.append([
+            Paragraph(item['name'], small),
+            str(item['quantity']),
+            f"{item['unit_price']:.2f}",
+            f"{item['total']:.2f}",
+        ])
+    rows.append(['Tax', '', '', f"{receipt.get('tax_amount') or 0:.2f}"])
+    if receipt.get('discount_amount'):
+        rows.append(['Discount', '', '', f"-{receipt['discount_amount']:.2f}"])
+    rows.append(['TOTAL', '', '', f"{receipt['total_amount']:.2f}"])
+
+    table = Table(rows, colWidths=[34 * mm, 8 * mm, 14 * mm, 14 * mm])
+    table.setStyle(TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LINEBELOW', (0, 0), (-1, 0), 0.5, colors.black),
+        ('LINEABOVE', (0, -1), (-1, -1), 0.5, colors.black),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 1),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 1),
+    ]))
+    story.append(table)
+    story.append(Spacer(1, 2 * mm))
+    story.append(Paragraph(f"Paid by {receipt.get('payment_method') or 'cash'}", small))
+    story.append(Spacer(1, 2 * mm))
+    story.append(Image(io.BytesIO(render_qr_png(receipt['transaction_id'])), width=24 * mm, height=24 * mm))
+    story.append(Paragraph('Thank you for your purchase!', small))
+
+    # Page height follows the number of lines so the roll is not wasted
+    height = (110 + 7 * len(receipt['items'])) * mm
+    output = io.BytesIO()
+    document = SimpleDocTemplate(
+        output, pagesize=(RECEIPT_WIDTH_MM * mm, height),
+        leftMargin=4 * mm, rightMargin=4 * mm, topMargin=4 * mm, bottomMargin=4 * mm,
+        title=f"Receipt {receipt['transaction_id']}"
+    )
+    document.build(story)
+    return output.getvalue()
+
+
+RENDERERS = {
+    'pdf': render_receipt_pdf,
+    'png': lambda receipt: render_qr_png(receipt['transaction_id'], box_size=8),
+}
+
+
+class ReceiptRenderer:
+    """Renders receipts on a bounded worker pool into a disk cache"""
+
+    def __init__(self, cache_dir, max_workers=2, max_pending=32):
+        self.cache_dir = cache_dir
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='receipt')
+        self._lock = threading.Lock()
+        self._pending = {}  # cache path -> Future, so concurrent requests share one render
+
+    def path(self, transaction_id, kind='pdf'):
+        if not SAFE_ID_RE.match(transaction_id):
+            raise ValueError('Invalid transaction id')
+        return os.path.join(self.cache_dir, f'v{RECEIPT_TEMPLATE_VERSION}', f'{transaction_id}.{kind}')
+
+    def cached(self, transaction_id, kind='pdf'):
+        """Cached bytes, or None when the receipt has not been rendered yet"""
+        try:
+            with open(self.path(transaction_id, kind), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def submit(self, receipt, kind='pdf'):
+        """Queue a render and return a Future of the receipt bytes"""
+        path = self.path(receipt['transaction_id'], kind)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is not None:
+                return future
+            if len(self._pending) >= self.max_pending:
+                raise ReceiptQueueFull()
+            future = self._executor.submit(self._render, path, kind, receipt)
+            self._pending[path] = future
+        future.add_done_callback(lambda _: self._forget(path))
+        return future
+
+    def get(self, transaction_id, load_receipt, kind='pdf', timeout=None):
+        """Receipt bytes from the cache, rendering them with ``load_receipt()`` on a miss"""
+        data = self.cached(transaction_id, kind)
+        if data is not None:
+            return data
+        receipt = load_receipt()
+        if receipt is None:
+            return None
+        return self.submit(receipt, kind).result(timeout=timeout)
+
+    def _forget(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def _render(self, path, kind, receipt):
+        data = RENDERERS[kind](receipt)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return data
@@ -0,0 +1,217 @@
+"""
+In-process product search index.
+
+Holds an inverted index of name, SKU, barcode and category tokens with a
+sorted vocabulary for prefix lookups and a trigram index over the
+vocabulary for typo-tolerant matching. Only product ids are ranked here;
+callers load the rows they need by primary key.
+"""
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Score for a query token matching a field, by match kind
+FIELD_WEIGHTS = {
+    'code': {'exact': 100.0, 'prefix': 20.0},
+    'name': {'exact': 10.0, 'prefix': 6.0},
+    'category': {'exact': 3.0, 'prefix': 2.0},
+}
+FUZZY_WEIGHT = 4.0
+FUZZY_MIN_SIMILARITY = 0.3
+FUZZY_MAX_GRAM_TOKENS = 2000  # trigrams shared by more tokens are too common to help
+MAX_PREFIX_EXPANSION = 500  # vocabulary tokens considered per query prefix
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(token):
+    """Padded character trigrams of a token"""
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def is_fuzzy_token(token):
+    """Words are matched with typo tolerance; codes and numbers never are"""
+    return len(token) >= 3 and not any(ch.isdigit() for ch in token)
+
+
+class ProductSearchIndex:
+    """Ranked prefix and fuzzy matching over product documents"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._docs = {}  # product_id -> {token: field}
+            self._names = {}  # product_id -> lowercase name, for tie-breaking
+            self._postings = {}  # token -> {product_id: field}
+            self._vocabulary = []  # sorted tokens, for prefix lookups
+            self._vocabulary_dirty = False  # set while bulk loading
+            self._trigrams = {}  # trigram -> set of tokens
+
+    def __len__(self):
+        return len(self._docs)
+
+    def load(self, documents):
+        """Rebuild the index from ``(product_id, name, sku, barcodes, category)`` tuples"""
+        with self._lock:
+            self.clear()
+            # Sort the vocabulary once at the end instead of per new token
+            self._vocabulary_dirty = True
+            for document in documents:
+                self.add(*document)
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+
+    def add(self, product_id, name='', sku='', barcodes=(), category=''):
+        """Index a product, replacing any previous entry for the same id"""
+        doc = {}
+        for token in tokenize(category):
+            doc[token] = 'category'
+        for token in tokenize(name):
+            doc[token] = 'name'
+        codes = [sku] + list(barcodes or [])
+        for code in codes:
+            code = (code or '').strip().lower()
+            if not code:
+                continue
+            doc[code] = 'code'
+            for token in tokenize(code):
+                doc.setdefault(token, 'code')
+
+        with self._lock:
+            self._remove(product_id)
+            self._docs[product_id] = doc
+            self._names[product_id] = (name or '').lower()
+            for token, field in doc.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    if not self._vocabulary_dirty:
+                        insort(self._vocabulary, token)
+                    if is_fuzzy_token(token):
+                        for gram in trigrams(token):
+                            self._trigrams.setdefault(gram, set()).add(token)
+                postings[product_id] = field
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        self._names.pop(product_id, None)
+        if not doc:
+            return
+        for token in doc:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                if not self._vocabulary_dirty:
+                    del self._vocabulary[bisect_left(self._vocabulary, token)]
+                if not is_fuzzy_token(token):
+                    continue
+                for gram in trigrams(token):
+                    tokens = self._trigrams.get(gram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._trigrams[gram]
+
+    def _prefix_tokens(self, prefix):
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, prefix)
+        matches = []
+        for i in range(start, min(start + MAX_PREFIX_EXPANSION, len(vocabulary))):
+            if not vocabulary[i].startswith(prefix):
+                break
+            matches.append(vocabulary[i])
+        return matches
+
+    def _fuzzy_tokens(self, token):
+        grams = trigrams(token)
+        shared = {}
+        for gram in grams:
+            tokens = self._trigrams.get(gram, ())
+            if len(tokens) > FUZZY_MAX_GRAM_TOKENS:
+                continue
+            for candidate in tokens:
+                shared[candidate] = shared.get(candidate, 0) + 1
+        matches = []
+        for candidate, common in shared.items():
+            similarity = common / (len(grams) + len(trigrams(candidate)) - common)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches.append((candidate, similarity))
+        return matches
+
+    def _score_token(self, token, fuzzy, restrict=None):
+        scores = {}
+        for candidate in self._prefix_tokens(token):
+            kind = 'exact' if candidate == token else 'prefix'
+            for product_id, field in self._postings[candidate].items():
+                if restrict is not None and product_id not in restrict:
+                    continue
+                score = FIELD_WEIGHTS[field][kind]
+                if score > scores.get(product_id, 0):
+                    scores[product_id] = score
+        # A token that exists verbatim is not a typo
+        if fuzzy and is_fuzzy_token(token) and token not in self._postings:
+            for candidate, similarity in self._fuzzy_tokens(token):
+                score = FUZZY_WEIGHT * similarity
+                for product_id in self._postings[candidate]:
+                    if restrict is not None and product_id not in restrict:
+                        continue
+                    if score > scores.get(product_id, 0):
+                        scores[product_id] = score
+        return scores
+
+    def search(self, query, limit=10, fuzzy=True):
+        """Return up to ``limit`` product ids ranked by relevance; None returns every match.
+
+        Every query token must match some field of a product, either as a
+        prefix of an indexed token or, when ``fuzzy`` is set, as a close
+        trigram match. The whole query is also tried as an exact SKU or
+        barcode so codes containing punctuation still rank first.
+        """
+        query = (query or '').strip().lower()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            # Longest tokens first: they are the most selective and narrow
+            # the candidates the remaining tokens have to score
+            combined = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                scores = self._score_token(token, fuzzy, restrict=combined)
+                if combined is None:
+                    combined = scores
+                else:
+                    combined = {pid: combined[pid] + score for pid, score in scores.items()}
+                if not combined:
+                    break
+            combined = combined or {}
+
+            for product_id, field in self._postings.get(query, {}).items():
+                if field == 'code':
+                    combined[product_id] = combined.get(product_id, 0) + FIELD_WEIGHTS['code']['exact']
+
+            names = self._names
+            rank = lambda item: (-item[1], len(names.get(item[0], '')), names.get(item[0], ''))
+            if limit is None:
+                ranked = sorted(combined.items(), key=rank)
+            else:
+                ranked = heapq.nsmallest(limit, combined.items(), key=rank)
+            return [product_id for product_id, _ in ranked]
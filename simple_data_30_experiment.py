@@ -11,13 +11,15 @@ from datetime import datetime
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-# Import Flask app and database models
-from app import app, db
-from app import Product, Category, Branch, Inventory
+# Import the app factory and database models
+from app import create_app
+from extensions import db
+from models import Product, Category, Branch, Inventory
 
 def create_sample_data():
     """Create 30 sample products with categories and inventory"""
 
+    app = create_app()
     with app.app_context():
         print("Creating sample data for POS system...")
 
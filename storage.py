@@ -0,0 +1,115 @@
+"""
+Database connection settings.
+
+One store runs on a SQLite file; a regional server points DATABASE_URL at
+PostgreSQL. For SQLite every new connection is switched to WAL journaling
+(readers no longer block the writer), ``synchronous=NORMAL`` (no fsync per
+commit, still safe in WAL mode), a busy timeout so a writer waits for the
+lock instead of failing with "database is locked", and memory-mapped reads.
+For PostgreSQL the connection pool is sized and recycled and dead
+connections are detected before use. ``storage_report`` reads back what the
+database actually applied, for the startup self-check.
+"""
+
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+SQLITE_SYNCHRONOUS = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+SQLITE_MIN_VERSION = (3, 35, 0)  # RETURNING, used by bulk catalog imports
+
+
+def backend_name(uri):
+    return make_url(uri).get_backend_name()
+
+
+def engine_options(uri, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database ``uri``"""
+    if backend_name(uri) == 'sqlite':
+        # Pragmas are applied per connection by install_sqlite_pragmas
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+    if backend_name(uri) == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS'] > 0:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def sqlite_pragmas(config):
+    """``(pragma, value)`` pairs applied to every SQLite connection, in order"""
+    return [
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),  # negative means KiB, not pages
+    ]
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Run the pragmas on each new connection of a SQLite ``engine``"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, value in pragmas:
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+        finally:
+            cursor.close()
+
+
+def storage_report(engine, config):
+    """Effective database settings and any warnings about them"""
+    settings = {'backend': engine.dialect.name, 'database': engine.url.render_as_string(hide_password=True)}
+    warnings = []
+
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            pragma = lambda name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            settings.update({
+                'sqlite_version': sqlite3.sqlite_version,
+                'journal_mode': pragma('journal_mode'),
+                'synchronous': SQLITE_SYNCHRONOUS.get(pragma('synchronous')),
+                'busy_timeout_ms': pragma('busy_timeout'),
+                'mmap_size': pragma('mmap_size'),
+                'cache_size': pragma('cache_size'),
+            })
+            if settings['journal_mode'].lower() != config['SQLITE_JOURNAL_MODE'].lower():
+                warnings.append(f"journal_mode is {settings['journal_mode']}, not {config['SQLITE_JOURNAL_MODE']}; "
+                                'WAL needs a local filesystem and a file database')
+            if settings['busy_timeout_ms'] == 0:
+                warnings.append('busy_timeout is 0: concurrent writers fail at once with "database is locked"')
+            if sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+                warnings.append(f'SQLite {sqlite3.sqlite_version} is older than '
+                                f"{'.'.join(map(str, SQLITE_MIN_VERSION))}; bulk catalog imports need RETURNING")
+        elif engine.dialect.name == 'postgresql':
+            settings.update({
+                'server_version': connection.exec_driver_sql('SHOW server_version').scalar(),
+                'max_connections': int(connection.exec_driver_sql('SHOW max_connections').scalar()),
+                'statement_timeout': connection.exec_driver_sql('SHOW statement_timeout').scalar(),
+            })
+
+    pool = engine.pool
+    if hasattr(pool, 'size'):
+        settings.update({
+            'pool': type(pool).__name__,
+            'pool_size': pool.size(),
+            'max_overflow': getattr(pool, '_max_overflow', None),
+            'pool_timeout': getattr(pool, '_timeout', None),
+            'pool_recycle': getattr(pool, '_recycle', None),
+        })
+    if 'max_connections' in settings and settings.get('pool_size') is not None:
+        per_process = settings['pool_size'] + max(settings['max_overflow'] or 0, 0)
+        if per_process >= settings['max_connections']:
+            warnings.append(f"one process may open {per_process} connections but the server allows "
+                            f"{settings['max_connections']}; lower DB_POOL_SIZE/DB_MAX_OVERFLOW")
+    return {'settings': settings, 'warnings': warnings}
@@ -0,0 +1,24 @@
+from extensions import db
+from helpers import product_list_query_counts
+from models import Branch, Category, Inventory, Product
+
+
+def test_products_list_query_count_is_constant(app):
+    # 75 products: a full page of 50, then a page of 25
+    db.session.add(Branch(name='Main Branch'))
+    db.session.add_all([Category(name='Drinks'), Category(name='Snacks')])
+    db.session.flush()
+    db.session.execute(db.insert(Product), [
+        {'name': f'Product {i:03d}', 'sku': f'SKU{i:03d}', 'price': 1.0, 'category_id': 1 + i % 2}
+        for i in range(75)
+    ])
+    db.session.execute(db.insert(Inventory), [
+        {'product_id': product_id, 'branch_id': 1, 'quantity': product_id} for product_id in range(1, 76, 3)
+    ])
+    db.session.commit()
+
+    counts = product_list_query_counts(pages=2, per_page=50)
+
+    assert len(counts) == 2
+    assert counts[0] == counts[1]
+    assert counts[0] <= 2
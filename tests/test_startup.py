@@ -0,0 +1,11 @@
+import statistics
+
+from blueprints.admin import measure_startup
+
+
+def test_startup_within_budget_without_lazy_imports(app):
+    timings, loaded = measure_startup(3, app.root_path)
+
+    # Pillow, qrcode, ReportLab, openpyxl and NumPy are imported where they are used
+    assert not loaded, f'create_app() imported {sorted(loaded)}'
+    assert statistics.median(timings) <= app.config['STARTUP_BUDGET_MS']
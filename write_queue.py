@@ -0,0 +1,179 @@
+"""
+Group commit for write requests.
+
+With one SQLite file every commit takes the write lock and syncs the WAL,
+so many cashiers committing small sales mostly wait on each other. The
+``GroupCommitWriter`` owns a single writer thread: requests hand it a job
+(a function that adds rows to the session without committing) and wait on
+a Future. The thread runs every job queued at that moment in one
+transaction and commits them together, so a burst of sales costs one lock
+acquisition and one sync.
+
+Each job is flushed on its own, so a failure (insufficient stock, a
+duplicate idempotency key) is raised to the request that submitted it. The
+batch is then rolled back and the remaining jobs are run again without it.
+A request is answered only after the commit that contains its job
+succeeded, so a reported sale is as durable as with a per-request commit.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class WriteQueueFull(Exception):
+    """Raised when too many writes are already waiting for the writer"""
+
+
+class WriteTimeout(Exception):
+    """Raised when a write was not committed within the request's timeout.
+
+    The write may still be committed later; clients resend with the same
+    idempotency key to find out.
+    """
+
+
+class _Job:
+    __slots__ = ('func', 'args', 'kwargs', 'future')
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class GroupCommitWriter:
+    """Single writer thread committing queued jobs in groups"""
+
+    def __init__(self, session, context=None, max_batch=64, max_wait=0.002, max_pending=1000):
+        self.session = session  # scoped session; the writer thread gets its own
+        self.context = context  # callable returning a context manager entered by the thread
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.jobs = 0
+        self.failures = 0
+        self.reruns = 0
+
+    def submit(self, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)`` and return a Future of its result after commit"""
+        if self._queue.qsize() >= self.max_pending:
+            raise WriteQueueFull()
+        self._ensure_started()
+        job = _Job(func, args, kwargs)
+        self._queue.put(job)
+        return job.future
+
+    def run(self, func, *args, timeout=None, **kwargs):
+        """Submit a job and wait for its committed result"""
+        future = self.submit(func, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if future.done():
+                raise
+            raise WriteTimeout()
+
+    def stats(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'pending': self._queue.qsize(),
+            'batches': self.batches,
+            'jobs': self.jobs,
+            'avg_batch': round(self.jobs / self.batches, 2) if self.batches else None,
+            'failures': self.failures,
+            'reruns': self.reruns,
+        }
+
+    def _ensure_started(self):
+        # Started on first use so each forked worker process gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        if self.context is None:
+            self._serve()
+        else:
+            with self.context():
+                self._serve()
+
+    def _serve(self):
+        while True:
+            batch = [self._queue.get()]
+            # Wait briefly for more writers so a burst shares one commit
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit([job for job in batch if job.future.set_running_or_notify_cancel()])
+            finally:
+                self.session.close()
+
+    def _commit(self, jobs):
+        # A failed job is answered after the rest of its batch is committed, so
+        # a sale that lost a duplicate-key race can already see the winner
+        failed = []
+        try:
+            while jobs:
+                results = []
+                for job in jobs:
+                    try:
+                        results.append(job.func(*job.args, **job.kwargs))
+                        self.session.flush()
+                    except BaseException as e:
+                        self.session.rollback()
+                        failed.append((job, e))
+                        break
+                else:
+                    try:
+                        self.session.commit()
+                    except BaseException as e:
+                        self.session.rollback()
+                        if len(jobs) == 1:
+                            failed.append((jobs[0], e))
+                            return
+                        # The group failed as a whole; commit each job alone to find the culprit
+                        self.reruns += len(jobs)
+                        for job in jobs:
+                            self._commit_alone(job)
+                        return
+                    self.batches += 1
+                    self.jobs += len(jobs)
+                    for job, result in zip(jobs, results):
+                        job.future.set_result(result)
+                    return
+
+                # Run the rest again without the failed job
+                jobs = [job for job in jobs if job is not failed[-1][0]]
+                self.reruns += len(jobs)
+        finally:
+            self.failures += len(failed)
+            for job, e in failed:
+                job.future.set_exception(e)
+
+    def _commit_alone(self, job):
+        try:
+            result = job.func(*job.args, **job.kwargs)
+            self.session.commit()
+        except BaseException as e:
+            self.session.rollback()
+            self.failures += 1
+            job.future.set_exception(e)
+            return
+        self.batches += 1
+        self.jobs += 1
+        job.future.set_result(result)